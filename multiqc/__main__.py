@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+
+""" MultiQC command line interface. Run with `multiqc` or `python -m multiqc` """
+
+from multiqc import multiqc
+from multiqc.utils import config
+
+def run_multiqc():
+    # Add any extra plugin command line options
+    for entry_point in config.iter_entry_points('multiqc.cli_options.v1'):
+        opt_func = entry_point.load()
+        multiqc.run_cli = opt_func(multiqc.run_cli)
+    # Modify the default click error handling
+    multiqc.modify_usage_error(multiqc.run_cli)
+    # Call the main function
+    multiqc.run_cli(prog_name='multiqc')
+
+if __name__ == "__main__":
+    run_multiqc()
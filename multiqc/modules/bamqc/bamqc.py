@@ -33,11 +33,14 @@ class MultiqcModule(BaseMultiqcModule):
         # Store short sample Names, Run Names and Indices
         self.sample_name_info = dict() 
 
-        for f in self.find_log_files('bamqc'):
+        for f in self.find_log_files('bamqc', incremental='bamqc'):
             # remove all file extensions
             file_name = f['s_name'].replace(".annotated", "")
             self.parse_bamqc_log(f['f'], file_name, f)
 
+        # Restore reports that haven't changed since the last run, if running incrementally
+        self.incremental_merge('bamqc', self.bamqc_data, self.sample_name_info)
+
         # check reads for each sample and mark any outlier as 'fail'; otherwise, mark it as 'pass'    
         # bamqc_stats_warning is used to save whether a set of data has (mean - 2 standard deviations) < 0; if so, 
         # add a warning to the table near the progress bar
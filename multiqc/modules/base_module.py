@@ -9,12 +9,36 @@ import fnmatch
 import logging
 import markdown
 import os
+import pickle
 import re
 import textwrap
 
-from multiqc.utils import report, config, util_functions
+from multiqc.utils import report, config, util_functions, module_runner
 logger = logging.getLogger(__name__)
 
+def parse_log_file(args):
+    """
+    Read a found log file and run a parse function on it, for parse_log_files().
+    Returns a tuple of whether the file could be read and what the function returned.
+    Lives outside of the module class so that it can be run in a worker process.
+    """
+    parse_fn, f, filecontents, filehandles, filelines = args
+    if filehandles or filelines or filecontents:
+        try:
+            fh = report.open_log_file(f)
+            if not (filehandles or filelines):
+                with fh:
+                    f['f'] = fh.read()
+        except report.read_errors:
+            if config.report_readerrors:
+                logger.debug("Couldn't open filehandle when returning file: {}".format(f['fn']))
+            return False, None
+        if filehandles or filelines:
+            with fh:
+                f['f'] = fh if filehandles else report.iter_lines(fh, f['fn'])
+                return True, parse_fn(f)
+    return True, parse_fn(f)
+
 class BaseMultiqcModule(object):
 
     def __init__(self, name='base', anchor='base', target=None, href=None, info=None, comment=None, extra=None,
@@ -22,6 +46,8 @@ class BaseMultiqcModule(object):
 
         # Custom options from user config that can overwrite base module values
         mod_cust_config = getattr(self, 'mod_cust_config', {})
+        # The report that this module's results are added to
+        self.report = report.current
         self.name = mod_cust_config.get('name', name)
         self.anchor = report.save_htmlid( mod_cust_config.get('anchor', anchor) )
         target = mod_cust_config.get('target', target)
@@ -56,12 +82,23 @@ class BaseMultiqcModule(object):
                     self.comment = markdown.markdown(self.comment)
 
         self.sections = list()
+        # Where this module's records start in the runtime profile, moved on by add_section()
+        self.profile_mark = len(report.runtime_profile)
 
-    def find_log_files(self, sp_key, filecontents=True, filehandles=False):
+    def find_log_files(self, sp_key, filecontents=True, filehandles=False, filelines=False, incremental=None):
         """
         Return matches log files of interest.
         :param sp_key: Search pattern key specified in config
-        :param filehandles: Set to true to return a file handle instead of slurped file contents
+        :param filehandles: Set to true to return a file handle instead of slurped file contents.
+                            Compressed files are decompressed on the fly with config.decompress_logs
+        :param filelines: Set to true to return an iterator over the lines of the file, without
+                          line endings, instead of slurped file contents. Lines are split on
+                          universal newlines only (\\n, \\r\\n and \\r), and the file is read a buffer
+                          at a time to save memory. The lines must be read before moving on to the
+                          next file.
+        :param incremental: Name for this set of parsed data, for use with incremental_merge().
+                            If running with --incremental, files that haven't changed since the
+                            last run are skipped and their samples restored by incremental_merge()
         :return: Yields a dict with filename (fn), root directory (root), cleaned sample name
                  generated from the filename (s_name) and either the file contents or file handle
                  for the current matched file (f).
@@ -75,10 +112,7 @@ class BaseMultiqcModule(object):
 
         # Old, depreciated syntax support. Likely to be removed in a future version.
         if isinstance(sp_key, dict):
-            report.files[self.name] = list()
-            for sf in report.searchfiles:
-                if report.search_file(sp_key, {'fn': sf[0], 'root': sf[1]}):
-                    report.files[self.name].append({'fn': sf[0], 'root': sf[1]})
+            report.files[self.name] = report.search_pattern_files(sp_key)
             sp_key = self.name
             logwarn = "Depreciation Warning: {} - Please use new style for find_log_files()".format(self.name)
             if len(report.files[self.name]) > 0:
@@ -109,23 +143,188 @@ class BaseMultiqcModule(object):
                 else:
                     logger.debug("{} - Selecting '{}' as it matched the path_filters for '{}'".format(sp_key, f['fn'], self.name))
 
-            # Make a sample name from the filename
-            f['s_name'] = self.clean_s_name(f['fn'], f['root'])
-            if filehandles or filecontents:
+            # Skip files that haven't changed since the last run, if running incrementally
+            if incremental is not None and config.incremental:
+                if self.incremental_skip_file(incremental, f):
+                    logger.debug("{} - Skipping '{}' as it hasn't changed since the last run".format(sp_key, f['fn']))
+                    continue
+
+            # Make a sample name from the filename, without any compression extension
+            f['s_name'] = self.clean_s_name(report.strip_compression(f['fn']), f['root'])
+            if filehandles or filelines or filecontents:
                 try:
-                    with io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8') as fh:
+                    with report.open_log_file(f) as fh:
                         if filehandles:
                             f['f'] = fh
                             yield f
+                        elif filelines:
+                            f['f'] = report.iter_lines(fh, f['fn'])
+                            yield f
                         elif filecontents:
                             f['f'] = fh.read()
                             yield f
-                except (IOError, OSError, ValueError, UnicodeDecodeError):
+                except report.read_errors:
                     if config.report_readerrors:
                         logger.debug("Couldn't open filehandle when returning file: {}".format(f['fn']))
                         f['f'] = None
             else:
                 yield f
+        self.incremental_active = None
+
+    def parse_log_files(self, parse_fn, log_files, filecontents=True, filehandles=False, filelines=False):
+        """
+        Parse found log files in parallel, using a pool of config.parse_workers processes.
+        :param parse_fn: Function that is given a file dict with the file contents (or file handle)
+                         under 'f', as from find_log_files(), and returns the parsed data. Runs in
+                         a worker process, so must be a plain function that doesn't touch the module
+                         or the report, and both it and its result must be picklable.
+        :param log_files: File dicts from find_log_files(..., filecontents=False). Can be filtered
+                          first, and incremental= works as usual.
+        :param filecontents: Give parse_fn the contents of the file
+        :param filehandles: Give parse_fn a file handle instead of the contents
+        :param filelines: Give parse_fn an iterator over the lines of the file instead of the contents
+        :return: Yields a tuple of the file dict and the parsed data for each file that
+                 could be read, in the same order as log_files. Register data sources and
+                 check for duplicate sample names as usual when looping over these.
+        """
+        # Note which file is being parsed for incremental runs as each one is found
+        files = list()
+        for f in log_files:
+            files.append((f, getattr(self, 'incremental_active', None)))
+        self.incremental_active = None
+
+        num_workers = config.parse_workers
+        ctx = None
+        if num_workers is not None and num_workers > 1 and len(files) > 1:
+            ctx = module_runner.fork_context()
+        tasks = [(parse_fn, dict(f), filecontents, filehandles, filelines) for f, active in files]
+        if ctx is None:
+            results = (parse_log_file(t) for t in tasks)
+        else:
+            logger.debug("{} - Parsing {} files using {} processes".format(self.name, len(files), num_workers))
+            pool = ctx.Pool(num_workers, report.init_archive_worker)
+            results = pool.imap(parse_log_file, tasks, max(1, len(tasks) // (num_workers * 4)))
+        try:
+            for (f, active), (readable, parsed) in zip(files, results):
+                if not readable:
+                    continue
+                report.last_found_file = os.path.join(f['root'], f['fn'])
+                self.incremental_active = active
+                yield f, parsed
+            self.incremental_active = None
+            if ctx is not None:
+                pool.close()
+        except:
+            if ctx is not None:
+                pool.terminate()
+            raise
+        finally:
+            if ctx is not None:
+                pool.join()
+
+    def incremental_load(self):
+        """ Load the saved incremental state for this module from the last run """
+        if getattr(self, 'incremental_state', None) is None:
+            self.incremental_state = dict()
+            self.incremental_carried = dict()
+            self.incremental_sources = dict()
+            self.incremental_fn = os.path.join(config.incremental_dir, '{}.pickle'.format(self.anchor))
+            try:
+                with io.open(self.incremental_fn, 'rb') as fh:
+                    state = pickle.load(fh)
+                if state.get('signature') == self.incremental_signature():
+                    self.incremental_state = state['groups']
+                else:
+                    logger.debug("Incremental data was saved by a different MultiQC version or with different "
+                                 "sample name options, ignoring: {}".format(self.incremental_fn))
+            except (IOError, OSError):
+                logger.debug("No incremental data found for {}: {}".format(self.name, self.incremental_fn))
+            except Exception as e:
+                logger.warning("Couldn't load incremental data for {}: {}".format(self.name, e))
+        return self.incremental_state
+
+    def incremental_signature(self):
+        """
+        The MultiQC version and the options that change which samples are found
+        and what they are called. Saved incremental data is only used if these
+        are the same as when it was saved, so that restored samples are named
+        and filtered in the same way as freshly parsed ones.
+        """
+        mod_config = getattr(self, 'mod_cust_config', {})
+        return {
+            'version': config.version,
+            'prepend_dirs': config.prepend_dirs,
+            'prepend_dirs_depth': config.prepend_dirs_depth,
+            'prepend_dirs_sep': config.prepend_dirs_sep,
+            'fn_clean_sample_names': config.fn_clean_sample_names,
+            'fn_clean_exts': config.fn_clean_exts,
+            'fn_clean_trim': config.fn_clean_trim,
+            'sample_names_ignore': config.sample_names_ignore,
+            'sample_names_ignore_re': config.sample_names_ignore_re,
+            'path_filters': mod_config.get('path_filters'),
+            'path_filters_exclude': mod_config.get('path_filters_exclude')
+        }
+
+    def incremental_skip_file(self, group, f):
+        """
+        Check whether a file is unchanged since the last incremental run. If so, its
+        samples are remembered so that incremental_merge() can restore them and True
+        is returned. Otherwise, starts recording the samples that come from this file.
+        """
+        state = self.incremental_load()
+        source = os.path.abspath(os.path.join(f['root'], f['fn']))
+        try:
+            # Files inside archives are only as new as the archive itself
+            fstat = os.stat(f.get('archive', source))
+            fingerprint = [fstat.st_mtime, fstat.st_size]
+        except OSError:
+            fingerprint = None
+        prev = state.get(group, {}).get('sources', {}).get(source)
+        if fingerprint is not None and prev is not None and list(prev['fingerprint']) == fingerprint:
+            self.incremental_carried.setdefault(group, dict())[source] = prev
+            return True
+        self.incremental_sources.setdefault(group, dict())[source] = {'fingerprint': fingerprint, 'samples': []}
+        self.incremental_active = (group, source)
+        return False
+
+    def incremental_merge(self, group, *datasets):
+        """
+        Restore samples from files skipped by find_log_files(incremental=group) and
+        save the parsed data for the next run. Call once after parsing all files.
+        Does nothing unless running with --incremental.
+        :param group: The same name as given to find_log_files(incremental=...)
+        :param datasets: One or more dicts with sample names as keys. These are
+                         updated in place with samples restored from the last run.
+        :return: None
+        """
+        if not config.incremental:
+            return
+        state = self.incremental_load()
+        prev_data = state.get(group, {}).get('data', [])
+        num_restored = 0
+        for source, prev in self.incremental_carried.get(group, {}).items():
+            for section, s_name, s_source in prev['samples']:
+                if self.is_ignore_sample(s_name):
+                    continue
+                for data, pdata in zip(datasets, prev_data):
+                    if s_name in pdata and s_name not in data:
+                        data[s_name] = pdata[s_name]
+                self.add_data_source(s_name=s_name, source=s_source, section=section)
+                num_restored += 1
+        if num_restored > 0:
+            logger.info("{} - Restored {} samples from files that haven't changed since the last run".format(self.name, num_restored))
+
+        # Save everything for next time
+        sources = dict(self.incremental_carried.get(group, {}))
+        sources.update(self.incremental_sources.get(group, {}))
+        state[group] = {'sources': sources, 'data': list(datasets)}
+        try:
+            if not os.path.isdir(config.incremental_dir):
+                os.makedirs(config.incremental_dir)
+            with io.open(self.incremental_fn, 'wb') as fh:
+                pickle.dump({'signature': self.incremental_signature(), 'groups': state}, fh, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning("Couldn't save incremental data for {}: {}".format(self.name, e))
 
     def add_section(self, name=None, anchor=None, description='', comment='', helptext='', plot='', content='', autoformat=True, autoformat_type='markdown'):
         """ Add a section to the module report output """
@@ -166,6 +365,13 @@ class BaseMultiqcModule(object):
                 if autoformat_type == 'markdown':
                     helptext = markdown.markdown(helptext)
 
+        # Note this section against the plots made for it in the runtime profile,
+        # which are the plots made since the last section was added
+        for r in report.runtime_profile[self.profile_mark:]:
+            if r['type'] == 'plot' and 'section' not in r:
+                r['section'] = anchor
+        self.profile_mark = len(report.runtime_profile)
+
         # Strip excess whitespace
         description = description.strip()
         comment = comment.strip()
@@ -248,15 +454,18 @@ class BaseMultiqcModule(object):
             else:
                 return data
             for k,v in data.items():
-                # Match ignore glob patterns
-                glob_match = any( fnmatch.fnmatch(k, sn) for sn in config.sample_names_ignore )
-                re_match = any( re.match(sn, k) for sn in config.sample_names_ignore_re )
-                if not glob_match and not re_match:
+                if not self.is_ignore_sample(k):
                     newdata[k] = v
             return newdata
         except (TypeError, AttributeError):
             return data
 
+    def is_ignore_sample(self, s_name):
+        """ Check whether a sample name matches `sample_names_ignore` or `sample_names_ignore_re` """
+        glob_match = any( fnmatch.fnmatch(s_name, sn) for sn in config.sample_names_ignore )
+        re_match = any( re.match(sn, s_name) for sn in config.sample_names_ignore_re )
+        return glob_match or re_match
+
     def general_stats_addcols(self, data, headers=None, namespace=None):
         """ Helper function to add to the General Statistics variable.
         Adds to report.general_stats and does not return anything. Fills
@@ -308,6 +517,10 @@ class BaseMultiqcModule(object):
             if source is None:
                 source = os.path.abspath(os.path.join(f['root'], f['fn']))
             report.data_sources[module][section][s_name] = source
+            # Remember which samples came from the file currently being parsed
+            if getattr(self, 'incremental_active', None) is not None:
+                group, active_source = self.incremental_active
+                self.incremental_sources[group][active_source]['samples'].append((section, s_name, source))
         except AttributeError:
             logger.warning('Tried to add data source for {}, but was missing fields data'.format(self.name))
 
@@ -3,11 +3,13 @@
 """ MultiQC submodule to parse output from deepTools plotCoverage """
 
 import logging
+import numpy as np
 import re
-from collections import OrderedDict
+from collections import Counter, OrderedDict
 
 from multiqc import config
 from multiqc.plots import table, linegraph
+from multiqc.utils import tabular
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -16,7 +18,7 @@ class plotCoverageMixin():
     def parse_plotCoverage(self):
         """Find plotCoverage output. Both stdout and --outRawCounts"""
         self.deeptools_plotCoverageStdout = dict()
-        for f in self.find_log_files('deeptools/plotCoverageStdout'):
+        for f in self.find_log_files('deeptools/plotCoverageStdout', filelines=True):
             parsed_data = self.parsePlotCoverageStdout(f)
             for k, v in parsed_data.items():
                 if k in self.deeptools_plotCoverageStdout:
@@ -27,7 +29,7 @@ class plotCoverageMixin():
                 self.add_data_source(f, section='plotCoverage')
 
         self.deeptools_plotCoverageOutRawCounts= dict()
-        for f in self.find_log_files('deeptools/plotCoverageOutRawCounts'):
+        for f in self.find_log_files('deeptools/plotCoverageOutRawCounts', filecontents=False):
             parsed_data = self.parsePlotCoverageOutRawCounts(f)
             for k, v in parsed_data.items():
                 if k in self.deeptools_plotCoverageOutRawCounts:
@@ -103,7 +105,7 @@ class plotCoverageMixin():
     def parsePlotCoverageStdout(self, f):
         d = {}
         firstLine = True
-        for line in f['f'].splitlines():
+        for line in f['f']:
             if firstLine:
                 firstLine = False
                 continue
@@ -132,42 +134,31 @@ class plotCoverageMixin():
         return d
 
     def parsePlotCoverageOutRawCounts(self, f):
-        samples = []
-        d = {}
-        nCols = 0
+        # Count the bins with each coverage value, for each sample, a block of lines at a time
+        header = []
+        counts = None
         nRows = 0
-        for line in f['f'].splitlines():
-            if line.startswith('#plotCoverage'):
-                continue
-
-            cols = line.strip().split('\t')
-            if len(cols) < 4:
-                log.warning("{} was initially flagged as the output from plotCoverage --outRawCounts, but that seems to not be the case. Skipping...".format(f['fn']))
-                return dict()
-
-            if cols[0] == "#'chr'":
-                nCols = len(cols)
-                for col in cols[3:]:
-                    s_name = self.clean_s_name(col.strip("'"), f['root'])
-                    samples.append(s_name)
-                    d[s_name] = dict()
-                continue
-
-            if len(cols) != nCols:
-                log.warning("{} was initially flagged as the output from plotCoverage --outRawCounts, but that seems to not be the case. Skipping...".format(f['fn']))
-                return dict()
-
-            for i, v in enumerate(cols[3:]):
-                v = float(v)
-                if v not in d[samples[i]]:
-                    d[samples[i]][v] = 0
-                d[samples[i]][v] += 1
-            nRows += 1
-
-        # Convert values to a fraction
+        try:
+            for values, _ in tabular.iter_table(f, slice(3, None), header=header):
+                if counts is None:
+                    counts = [Counter() for i in range(values.shape[1])]
+                for i, c in enumerate(counts):
+                    coverage, n = np.unique(values[:, i], return_counts=True)
+                    c.update(dict(zip(coverage.tolist(), n.tolist())))
+                nRows += values.shape[0]
+        except ValueError as e:
+            log.debug("Couldn't read {}: {}".format(f['fn'], e))
+            counts = None
+        cols = [c.strip().split('\t') for c in header if c.startswith("#'chr'")]
+        if counts is None or len(cols) == 0 or len(cols[0]) < 4 or len(cols[0]) - 3 != len(counts):
+            log.warning("{} was initially flagged as the output from plotCoverage --outRawCounts, but that seems to not be the case. Skipping...".format(f['fn']))
+            return dict()
+
+        # Convert counts to a fraction
+        d = {}
         nRows = float(nRows)
-        for k, v in d.items():
-            for k2, v2 in v.items():
-                v[k2] /= nRows
+        for col, c in zip(cols[0][3:], counts):
+            s_name = self.clean_s_name(col.strip("'"), f['root'])
+            d[s_name] = dict((k, v / nRows) for k, v in c.items())
 
         return d
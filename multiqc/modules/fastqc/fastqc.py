@@ -12,6 +12,7 @@
 
 from __future__ import print_function
 from collections import OrderedDict
+from contextlib import closing
 import io
 import json
 import logging
@@ -22,10 +23,125 @@ import zipfile
 from multiqc import config
 from multiqc.plots import linegraph, bargraph
 from multiqc.modules.base_module import BaseMultiqcModule
+from multiqc.utils import report
 
 # Initialise the logger
 log = logging.getLogger(__name__)
 
+def avg_bp_from_range(bp):
+    """ Helper function - FastQC often gives base pair ranges (eg. 10-15)
+    which are not helpful when plotting. This returns the average from such
+    ranges as an int, which is helpful. If not a range, just returns the int """
+
+    try:
+        if '-' in bp:
+            maxlen = float(bp.split("-",1)[1])
+            minlen = float(bp.split("-",1)[0])
+            bp = ((maxlen - minlen)/2) + minlen
+    except TypeError:
+        pass
+    return(int(bp))
+
+def parse_fastqc_data(file_contents):
+    """ Takes contents from a fastq_data.txt file and parses out required
+    statistics and data. Returns the input filename given in the report (or None),
+    a dict of the statuses and parsed sections, and the order of the duplication keys. """
+
+    # Get the input filename if we find it, to make the sample name
+    fn = None
+    fn_search = re.search(r"Filename\s+(.+)", file_contents)
+    if fn_search:
+        fn = fn_search.group(1)
+
+    data = { 'statuses': dict() }
+
+    # Parse the report
+    section = None
+    s_headers = None
+    dup_keys = []
+    for l in file_contents.splitlines():
+        if l == '>>END_MODULE':
+            section = None
+            s_headers = None
+        elif l.startswith('>>'):
+            (section, status) = l[2:].split("\t", 1)
+            section = section.lower().replace(' ', '_')
+            data['statuses'][section] = status
+        elif section is not None:
+            if l.startswith('#'):
+                s_headers = l[1:].split("\t")
+                # Special case: Total Deduplicated Percentage header line
+                if s_headers[0] == 'Total Deduplicated Percentage':
+                    data['basic_statistics'].append({
+                        'measure': 'total_deduplicated_percentage',
+                        'value': float(s_headers[1])
+                    })
+                else:
+                    # Special case: Rename dedup header in old versions of FastQC (v10)
+                    if s_headers[1] == 'Relative count':
+                        s_headers[1] = 'Percentage of total'
+                    s_headers = [s.lower().replace(' ', '_') for s in s_headers]
+                    data[section] = list()
+
+            elif s_headers is not None:
+                s = l.split("\t")
+                row = dict()
+                for (i, v) in enumerate(s):
+                    v.replace('NaN','0')
+                    try:
+                        v = float(v)
+                    except ValueError:
+                        pass
+                    row[s_headers[i]] = v
+                data[section].append(row)
+                # Special case - need to remember order of duplication keys
+                if section == 'sequence_duplication_levels':
+                    try:
+                        dup_keys.append(float(s[0]))
+                    except ValueError:
+                        dup_keys.append(s[0])
+
+    # Tidy up the Basic Stats
+    data['basic_statistics'] = {d['measure']: d['value'] for d in data['basic_statistics']}
+
+    # Calculate the average sequence length (Basic Statistics gives a range)
+    length_bp = 0
+    total_count = 0
+    for d in data.get('sequence_length_distribution', {}):
+        length_bp += d['count'] * avg_bp_from_range(d['length'])
+        total_count += d['count']
+    if total_count > 0:
+        data['basic_statistics']['avg_sequence_length'] = length_bp / total_count
+
+    return fn, data, dup_keys
+
+def parse_fastqc_data_file(f):
+    """ Parse an unzipped fastqc_data.txt file. Run by parse_log_files() """
+    return parse_fastqc_data(f['f'])
+
+def parse_fastqc_zip(f):
+    """ Parse the fastqc_data.txt file inside a FastQC zip file. Run by parse_log_files().
+    Returns an error ('bad_zip' or 'no_data', or None) and the parsed report. """
+    try:
+        zip_fh = report.open_log_file(f, binary=True)
+    except Exception as e:
+        return 'bad_zip', str(e)
+    # Close the zip file and the file handle it reads, whatever happens
+    with closing(zip_fh):
+        try:
+            fqc_zip = zipfile.ZipFile(zip_fh)
+        except Exception as e:
+            return 'bad_zip', str(e)
+        with closing(fqc_zip):
+            # FastQC zip files should have just one directory inside, containing report
+            d_name = fqc_zip.namelist()[0]
+            try:
+                with fqc_zip.open(os.path.join(d_name, 'fastqc_data.txt')) as fh:
+                    r_data = fh.read().decode('utf8')
+            except KeyError:
+                return 'no_data', None
+    return None, parse_fastqc_data(r_data)
+
 class MultiqcModule(BaseMultiqcModule):
 
     def __init__(self):
@@ -37,35 +153,46 @@ class MultiqcModule(BaseMultiqcModule):
         " written by Simon Andrews at the Babraham Institute in Cambridge.")
 
         self.fastqc_data = dict()
+        self.fastqc_dup_keys = dict()
+        self.dup_keys = []
 
         # Find and parse unzipped FastQC reports
-        for f in self.find_log_files('fastqc/data'):
+        log_files = self.find_log_files('fastqc/data', filecontents=False, incremental='fastqc')
+        for f, parsed in self.parse_log_files(parse_fastqc_data_file, log_files):
             s_name = self.clean_s_name(os.path.basename(f['root']), os.path.dirname(f['root']))
-            self.parse_fastqc_report(f['f'], s_name, f)
+            self.add_fastqc_report(parsed, s_name, f)
 
         # Find and parse zipped FastQC reports
-        for f in self.find_log_files('fastqc/zip', filecontents=False):
+        def zip_s_name(f):
             s_name = f['fn']
             if s_name.endswith('_fastqc.zip'):
                 s_name = s_name[:-11]
-            # Skip if we already have this report - parsing zip files is slow..
+            return s_name
+        # Skip if we already have this report - parsing zip files is slow..
+        log_files = (f for f in self.find_log_files('fastqc/zip', filecontents=False, incremental='fastqc')
+                     if zip_s_name(f) not in self.fastqc_data)
+        for f, (error, parsed) in self.parse_log_files(parse_fastqc_zip, log_files, filecontents=False):
+            s_name = zip_s_name(f)
+            # May have been added by an earlier zip file since being sent to be parsed
             if s_name in self.fastqc_data.keys():
                 log.debug("Skipping '{}' as already parsed '{}'".format(f['fn'], s_name))
                 continue
-            try:
-                fqc_zip = zipfile.ZipFile(os.path.join(f['root'], f['fn']))
-            except Exception as e:
+            if error == 'bad_zip':
                 log.warn("Couldn't read '{}' - Bad zip file".format(f['fn']))
-                log.debug("Bad zip file error:\n{}".format(e))
-                continue
-            # FastQC zip files should have just one directory inside, containing report
-            d_name = fqc_zip.namelist()[0]
-            try:
-                with fqc_zip.open(os.path.join(d_name, 'fastqc_data.txt')) as fh:
-                    r_data = fh.read().decode('utf8')
-                    self.parse_fastqc_report(r_data, s_name, f)
-            except KeyError:
+                log.debug("Bad zip file error:\n{}".format(parsed))
+            elif error == 'no_data':
                 log.warning("Error - can't find fastqc_raw_data.txt in {}".format(f))
+            else:
+                self.add_fastqc_report(parsed, s_name, f)
+
+        # Restore reports that haven't changed since the last run, if running incrementally
+        self.incremental_merge('fastqc', self.fastqc_data, self.fastqc_dup_keys)
+        if len(self.dup_keys) == 0:
+            # Every report was restored, so use the duplication levels saved with them
+            for s_name in self.fastqc_data:
+                if len(self.fastqc_dup_keys.get(s_name, [])) > 0:
+                    self.dup_keys = self.fastqc_dup_keys[s_name]
+                    break
 
         # Filter to strip out ignored sample names
         self.fastqc_data = self.ignore_samples(self.fastqc_data)
@@ -116,76 +243,25 @@ class MultiqcModule(BaseMultiqcModule):
 
     def parse_fastqc_report(self, file_contents, s_name=None, f=None):
         """ Takes contents from a fastq_data.txt file and parses out required
-        statistics and data. Returns a dict with keys 'stats' and 'data'.
-        Data is for plotting graphs, stats are for top table. """
+        statistics and data, adding them to the report. """
+        self.add_fastqc_report(parse_fastqc_data(file_contents), s_name, f)
 
-        # Make the sample name from the input filename if we find it
-        fn_search = re.search(r"Filename\s+(.+)", file_contents)
-        if fn_search:
-            s_name = self.clean_s_name(fn_search.group(1) , f['root'])
+    def add_fastqc_report(self, parsed, s_name=None, f=None):
+        """ Adds a report parsed by parse_fastqc_data() to the module's data.
+        Runs in the main process, so that duplicate sample names are found
+        and data sources added in the same order as the files. """
+
+        # Make the sample name from the input filename if we found it
+        fn, data, dup_keys = parsed
+        if fn is not None:
+            s_name = self.clean_s_name(fn, f['root'])
 
         if s_name in self.fastqc_data.keys():
             log.debug("Duplicate sample name found! Overwriting: {}".format(s_name))
         self.add_data_source(f, s_name)
-        self.fastqc_data[s_name] = { 'statuses': dict() }
-
-        # Parse the report
-        section = None
-        s_headers = None
-        self.dup_keys = []
-        for l in file_contents.splitlines():
-            if l == '>>END_MODULE':
-                section = None
-                s_headers = None
-            elif l.startswith('>>'):
-                (section, status) = l[2:].split("\t", 1)
-                section = section.lower().replace(' ', '_')
-                self.fastqc_data[s_name]['statuses'][section] = status
-            elif section is not None:
-                if l.startswith('#'):
-                    s_headers = l[1:].split("\t")
-                    # Special case: Total Deduplicated Percentage header line
-                    if s_headers[0] == 'Total Deduplicated Percentage':
-                        self.fastqc_data[s_name]['basic_statistics'].append({
-                            'measure': 'total_deduplicated_percentage',
-                            'value': float(s_headers[1])
-                        })
-                    else:
-                        # Special case: Rename dedup header in old versions of FastQC (v10)
-                        if s_headers[1] == 'Relative count':
-                            s_headers[1] = 'Percentage of total'
-                        s_headers = [s.lower().replace(' ', '_') for s in s_headers]
-                        self.fastqc_data[s_name][section] = list()
-
-                elif s_headers is not None:
-                    s = l.split("\t")
-                    row = dict()
-                    for (i, v) in enumerate(s):
-                        v.replace('NaN','0')
-                        try:
-                            v = float(v)
-                        except ValueError:
-                            pass
-                        row[s_headers[i]] = v
-                    self.fastqc_data[s_name][section].append(row)
-                    # Special case - need to remember order of duplication keys
-                    if section == 'sequence_duplication_levels':
-                        try:
-                            self.dup_keys.append(float(s[0]))
-                        except ValueError:
-                            self.dup_keys.append(s[0])
-
-        # Tidy up the Basic Stats
-        self.fastqc_data[s_name]['basic_statistics'] = {d['measure']: d['value'] for d in self.fastqc_data[s_name]['basic_statistics']}
-
-        # Calculate the average sequence length (Basic Statistics gives a range)
-        length_bp = 0
-        total_count = 0
-        for d in self.fastqc_data[s_name].get('sequence_length_distribution', {}):
-            length_bp += d['count'] * self.avg_bp_from_range(d['length'])
-            total_count += d['count']
-        if total_count > 0:
-            self.fastqc_data[s_name]['basic_statistics']['avg_sequence_length'] = length_bp / total_count
+        self.fastqc_data[s_name] = data
+        self.fastqc_dup_keys[s_name] = dup_keys
+        self.dup_keys = dup_keys
 
     def fastqc_general_stats(self):
         """ Add some single-number stats to the basic statistics
@@ -911,18 +987,8 @@ class MultiqcModule(BaseMultiqcModule):
 
 
     def avg_bp_from_range(self, bp):
-        """ Helper function - FastQC often gives base pair ranges (eg. 10-15)
-        which are not helpful when plotting. This returns the average from such
-        ranges as an int, which is helpful. If not a range, just returns the int """
-
-        try:
-            if '-' in bp:
-                maxlen = float(bp.split("-",1)[1])
-                minlen = float(bp.split("-",1)[0])
-                bp = ((maxlen - minlen)/2) + minlen
-        except TypeError:
-            pass
-        return(int(bp))
+        """ Helper function - see avg_bp_from_range() """
+        return avg_bp_from_range(bp)
 
     def get_status_cols(self, section):
         """ Helper function - returns a list of colours according to the FastQC
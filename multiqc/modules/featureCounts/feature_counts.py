@@ -28,7 +28,7 @@ class MultiqcModule(BaseMultiqcModule):
         # Find and load any featureCounts reports
         self.featurecounts_data = dict()
         self.featurecounts_keys = list()
-        for f in self.find_log_files('featurecounts'):
+        for f in self.find_log_files('featurecounts', filelines=True):
             self.parse_featurecounts_report(f)
 
         # Filter to strip out ignored sample names
@@ -54,7 +54,7 @@ class MultiqcModule(BaseMultiqcModule):
 
         file_names = list()
         parsed_data = dict()
-        for l in f['f'].splitlines():
+        for l in f['f']:
             thisrow = list()
             s = l.split("\t")
             if len(s) < 2:
@@ -5,9 +5,11 @@ https://github.com/brentp/goleft/tree/master/indexcov
 from __future__ import print_function
 import collections
 import logging
+import numpy as np
 
 from multiqc import config
 from multiqc.plots import linegraph, scatter
+from multiqc.utils import report, tabular
 from multiqc.modules.base_module import BaseMultiqcModule
 
 # Initialise the logger
@@ -45,21 +47,46 @@ class MultiqcModule(BaseMultiqcModule):
         elif isinstance(chrom_clean, int) or chrom_clean in default_allowed:
             return chrom_clean
 
+    def _parse_roc_lines(self, f, data):
+        """Parse a ROC file a line at a time, skipping any lines that can't be read."""
+        with report.open_log_file(f) as fh:
+            header = fh.readline()
+            sample_names = [self.clean_s_name(x, f["root"]) for x in header.strip().split()[2:]]
+            for parts in (l.rstrip().split() for l in fh):
+                if len(parts) > 2:
+                    chrom, cov = parts[:2]
+                    if self._short_chrom(chrom) is not None:
+                        try:
+                            cov = float(cov)
+                            sample_vals = [float(val) for val, sample in zip(parts[2:], sample_names)]
+                        except ValueError:
+                            continue
+                        for val, sample in zip(sample_vals, sample_names):
+                            data[chrom][sample][cov] = val
+
     def roc_plot(self):
         helptext = 'Lower coverage samples have shorter curves where the proportion of regions covered \n\
         drops off more quickly. This indicates a higher fraction of low coverage regions.'
         max_chroms = 50
         data = collections.defaultdict(lambda: collections.defaultdict(dict))
-        for fn in self.find_log_files('goleft_indexcov/roc', filehandles=True):
-            header = fn['f'].readline()
-            sample_names = [self.clean_s_name(x, fn["root"]) for x in header.strip().split()[2:]]
-            for parts in (l.rstrip().split() for l in fn['f']):
-                if len(parts) > 2:
-                    chrom, cov = parts[:2]
-                    sample_vals = parts[2:]
-                    if self._short_chrom(chrom) is not None:
-                        for val, sample in zip(sample_vals, sample_names):
-                            data[chrom][sample][float(cov)] = float(val)
+        for fn in self.find_log_files('goleft_indexcov/roc', filecontents=False):
+            try:
+                header, values, (chroms,) = tabular.read_table(fn, slice(1, None), text_cols=[0], num_header_lines=1)
+            except ValueError as e:
+                # Ragged or malformed lines, such as a partial line at the end of the file
+                log.debug("Reading goleft indexcov ROC file {} a line at a time: {}".format(fn['fn'], e))
+                self._parse_roc_lines(fn, data)
+                continue
+            if len(header) == 0:
+                continue
+            sample_names = [self.clean_s_name(x, fn["root"]) for x in header[0].strip().split()[2:]]
+            for chrom in np.unique(chroms):
+                chrom_rows = chroms == chrom
+                chrom = chrom.decode('utf-8')
+                if self._short_chrom(chrom) is not None:
+                    cov = values[chrom_rows, 0].tolist()
+                    for i, sample in enumerate(sample_names[:values.shape[1] - 1]):
+                        data[chrom][sample].update(zip(cov, values[chrom_rows, i + 1].tolist()))
 
         # Filter to strip out ignored sample names
         for chrom in data:
@@ -13,6 +13,36 @@ from multiqc.plots import bargraph
 log = logging.getLogger(__name__)
 
 
+def parse_markdups_log(f):
+    """ Parse the duplication metrics from a Picard MarkDuplicates log. Run by parse_log_files().
+    Returns a list with the input filename and metrics for each sample found in the log. """
+    samples = list()
+    fn = None
+    for l in f['f']:
+        # New log starting
+        if 'markduplicates' in l.lower() and 'input' in l.lower():
+            fn = None
+
+            # Pull sample name from input
+            fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
+            if fn_search:
+                fn = os.path.basename(fn_search.group(1).strip('[]'))
+
+        if fn is not None:
+            if 'DuplicationMetrics' in l and '## METRICS CLASS' in l:
+                metrics = dict()
+                keys = f['f'].readline().rstrip("\n").split("\t")
+                vals = f['f'].readline().rstrip("\n").split("\t")
+                for i, k in enumerate(keys):
+                    try:
+                        metrics[k] = float(vals[i])
+                    except ValueError:
+                        metrics[k] = vals[i]
+                samples.append((fn, metrics))
+                fn = None
+    return samples
+
+
 def parse_reports(self):
     """ Find Picard MarkDuplicates reports and parse their data """
 
@@ -20,38 +50,19 @@ def parse_reports(self):
     self.picard_dupMetrics_data = dict()
 
     # Go through logs and find Metrics
-    for f in self.find_log_files('picard/markdups', filehandles=True):
-        s_name = None
-        for l in f['f']:
-            # New log starting
-            if 'markduplicates' in l.lower() and 'input' in l.lower():
-                s_name = None
-
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-
-            if s_name is not None:
-                if 'DuplicationMetrics' in l and '## METRICS CLASS' in l:
-                    if s_name in self.picard_dupMetrics_data:
-                        log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
-                    self.add_data_source(f, s_name, section='DuplicationMetrics')
-                    self.picard_dupMetrics_data[s_name] = dict()
-                    keys = f['f'].readline().rstrip("\n").split("\t")
-                    vals = f['f'].readline().rstrip("\n").split("\t")
-                    for i, k in enumerate(keys):
-                        try:
-                            self.picard_dupMetrics_data[s_name][k] = float(vals[i])
-                        except ValueError:
-                            self.picard_dupMetrics_data[s_name][k] = vals[i]
-                    # Check that this sample had some reads
-                    if self.picard_dupMetrics_data[s_name].get('READ_PAIRS_EXAMINED', 0) == 0 and \
-                       self.picard_dupMetrics_data[s_name].get('UNPAIRED_READS_EXAMINED', 0) == 0:
-                        self.picard_dupMetrics_data.pop(s_name, None)
-                        log.warn("Skipping MarkDuplicates sample '{}' as log contained no reads".format(s_name))
-                    s_name = None
+    log_files = self.find_log_files('picard/markdups', filecontents=False)
+    for f, samples in self.parse_log_files(parse_markdups_log, log_files, filehandles=True):
+        for fn, metrics in samples:
+            s_name = self.clean_s_name(fn, f['root'])
+            if s_name in self.picard_dupMetrics_data:
+                log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
+            self.add_data_source(f, s_name, section='DuplicationMetrics')
+            self.picard_dupMetrics_data[s_name] = metrics
+            # Check that this sample had some reads
+            if self.picard_dupMetrics_data[s_name].get('READ_PAIRS_EXAMINED', 0) == 0 and \
+               self.picard_dupMetrics_data[s_name].get('UNPAIRED_READS_EXAMINED', 0) == 0:
+                self.picard_dupMetrics_data.pop(s_name, None)
+                log.warn("Skipping MarkDuplicates sample '{}' as log contained no reads".format(s_name))
 
         for s_name in list(self.picard_dupMetrics_data.keys()):
             if len(self.picard_dupMetrics_data[s_name]) == 0:
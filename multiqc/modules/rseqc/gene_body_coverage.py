@@ -4,6 +4,7 @@
 http://rseqc.sourceforge.net/#genebody-coverage-py """
 
 from collections import OrderedDict
+import itertools
 import logging
 
 from multiqc.plots import linegraph
@@ -23,13 +24,14 @@ def parse_reports(self):
     # and add these to the general stats table?
 
     # Go through files and parse data
-    for f in self.find_log_files('rseqc/gene_body_coverage'):
+    for f in self.find_log_files('rseqc/gene_body_coverage', filelines=True):
+        header = next(f['f'], '')
 
         # RSeQC >= v2.4
-        if f['f'].startswith('Percentile'):
-            keys = []
+        if header.startswith('Percentile'):
+            keys = header.split()[1:]
             nrows = 0
-            for l in f['f'].splitlines():
+            for l in f['f']:
                 s = l.split()
                 if len(keys) == 0:
                     keys = s[1:]
@@ -47,7 +49,7 @@ def parse_reports(self):
 
 
         # RSeQC < v2.4
-        elif f['f'].startswith('Total reads'):
+        elif header.startswith('Total reads'):
             if f['s_name'].endswith('.geneBodyCoverage'):
                 f['s_name'] = f['s_name'][:-17]
             if f['s_name'] in self.gene_body_cov_hist_counts:
@@ -55,7 +57,7 @@ def parse_reports(self):
             self.add_data_source(f, section='gene_body_coverage')
             self.gene_body_cov_hist_counts[f['s_name']] = OrderedDict()
             nrows = 0
-            for l in f['f'].splitlines():
+            for l in itertools.chain([header], f['f']):
                 s = l.split()
                 try:
                     nrows += 1
@@ -20,13 +20,13 @@ def parse_reports(self):
     self.inner_distance_pct = dict()
 
     # Go through files and parse data
-    for f in self.find_log_files('rseqc/inner_distance'):
+    for f in self.find_log_files('rseqc/inner_distance', filelines=True):
         if f['s_name'] in self.inner_distance:
             log.debug("Duplicate sample name found! Overwriting: {}".format(f['s_name']))
         self.add_data_source(f, section='inner_distance')
         #saving to temporary variable fro SE checking later
         parsed_data = OrderedDict()
-        for l in f['f'].splitlines():
+        for l in f['f']:
             s = l.split()
             try:
                 avg_pos = (float(s[0]) +  float(s[1])) / 2.0
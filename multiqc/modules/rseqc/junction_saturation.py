@@ -22,9 +22,9 @@ def parse_reports(self):
     self.junction_saturation_novel = dict()
 
     # Go through files and parse data
-    for f in self.find_log_files('rseqc/junction_saturation'):
+    for f in self.find_log_files('rseqc/junction_saturation', filelines=True):
         parsed = dict()
-        for l in f['f'].splitlines():
+        for l in f['f']:
             r = re.search(r"^([xyzw])=c\(([\d,]+)\)$", l)
             if r:
                 parsed[r.group(1)] = [float(i) for i in r.group(2).split(',')]
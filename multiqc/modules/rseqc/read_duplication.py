@@ -19,13 +19,13 @@ def parse_reports(self):
     self.read_dups = dict()
 
     # Go through files and parse data
-    for f in self.find_log_files('rseqc/read_duplication_pos'):
-        if f['f'].startswith('Occurrence	UniqReadNumber'):
+    for f in self.find_log_files('rseqc/read_duplication_pos', filelines=True):
+        if next(f['f'], '').startswith('Occurrence	UniqReadNumber'):
             if f['s_name'] in self.read_dups:
                 log.debug("Duplicate sample name found! Overwriting: {}".format(f['s_name']))
             self.add_data_source(f, section='read_duplication')
             self.read_dups[f['s_name']] = OrderedDict()
-            for l in f['f'].splitlines():
+            for l in f['f']:
                 s = l.split()
                 try:
                     if int(s[0]) <= 500:
@@ -20,12 +20,12 @@ def parse_reports(self):
     self.read_gc_pct = dict()
 
     # Go through files and parse data
-    for f in self.find_log_files('rseqc/read_gc'):
+    for f in self.find_log_files('rseqc/read_gc', filelines=True):
 
-        if f['f'].startswith('GC%	read_count'):
+        if next(f['f'], '').startswith('GC%	read_count'):
             gc = list()
             counts = list()
-            for l in f['f'].splitlines():
+            for l in f['f']:
                 s = l.split()
                 try:
                     gc.append(float(s[0]))
@@ -12,6 +12,27 @@ from multiqc.plots import beeswarm, bargraph
 log = logging.getLogger(__name__)
 
 
+def parse_stats_report(f):
+    """ Parse the summary numbers from a Samtools stats log. Run by parse_log_files() """
+    parsed_data = dict()
+    for line in f['f']:
+        if not line.startswith("SN"):
+            continue
+        sections = line.split("\t")
+        field = sections[1].strip()[:-1]
+        field = field.replace(' ', '_')
+        value = float(sections[2].strip())
+        parsed_data[field] = value
+
+    # Work out some percentages
+    if 'raw_total_sequences' in parsed_data:
+        for k in list(parsed_data.keys()):
+            if k.startswith('reads_') and k != 'raw_total_sequences' and parsed_data['raw_total_sequences'] > 0:
+                parsed_data['{}_percent'.format(k)] = (parsed_data[k] / parsed_data['raw_total_sequences']) * 100
+
+    return parsed_data
+
+
 class StatsReportMixin():
     """ Mixin class, loaded by main samtools MuliqcModule class. """
 
@@ -19,30 +40,18 @@ class StatsReportMixin():
         """ Find Samtools stats logs and parse their data """
 
         self.samtools_stats = dict()
-        for f in self.find_log_files('samtools/stats'):
-            parsed_data = dict()
-            for line in f['f'].splitlines():
-                if not line.startswith("SN"):
-                    continue
-                sections = line.split("\t")
-                field = sections[1].strip()[:-1]
-                field = field.replace(' ', '_')
-                value = float(sections[2].strip())
-                parsed_data[field] = value
-
+        log_files = self.find_log_files('samtools/stats', filecontents=False, incremental='samtools_stats')
+        for f, parsed_data in self.parse_log_files(parse_stats_report, log_files, filelines=True):
             if len(parsed_data) > 0:
-                # Work out some percentages
-                if 'raw_total_sequences' in parsed_data:
-                    for k in list(parsed_data.keys()):
-                        if k.startswith('reads_') and k != 'raw_total_sequences' and parsed_data['raw_total_sequences'] > 0:
-                            parsed_data['{}_percent'.format(k)] = (parsed_data[k] / parsed_data['raw_total_sequences']) * 100
-
                 if f['s_name'] in self.samtools_stats:
                     log.debug("Duplicate sample name found! Overwriting: {}"
                               .format(f['s_name']))
                 self.add_data_source(f, section='stats')
                 self.samtools_stats[f['s_name']] = parsed_data
 
+        # Restore reports that haven't changed since the last run, if running incrementally
+        self.incremental_merge('samtools_stats', self.samtools_stats)
+
         # Filter to strip out ignored sample names
         self.samtools_stats = self.ignore_samples(self.samtools_stats)
 
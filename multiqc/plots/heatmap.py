@@ -6,12 +6,13 @@ from __future__ import print_function
 import logging
 import random
 
-from multiqc.utils import report
+from multiqc.utils import report, profiling
 
 logger = logging.getLogger(__name__)
 
 letters = 'abcdefghijklmnopqrstuvwxyz'
 
+@profiling.timed_plot('heatmap')
 def plot (data, xcats, ycats=None, pconfig=None):
     """ Plot a 2D heatmap.
     :param data: List of lists, each a representing a row of values.
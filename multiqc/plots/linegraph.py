@@ -11,32 +11,41 @@ import os
 import random
 import sys
 
-from multiqc.utils import config, report, util_functions
+from multiqc.utils import config, report, util_functions, profiling
 logger = logging.getLogger(__name__)
 
-try:
-    # Import matplot lib but avoid default X environment
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-except Exception as e:
-    # MatPlotLib can break in a variety of ways. Fake an error message and continue without it if so.
-    # The lack of the library will be handled when plots are attempted
-    print("##### ERROR! MatPlotLib library could not be loaded!    #####", file=sys.stderr)
-    print("##### Flat plots will instead be plotted as interactive #####", file=sys.stderr)
-    print(e)
+# MatPlotLib is slow to import, so is only loaded when the first flat plot is made
+plt = None
+def load_matplotlib():
+    global plt
+    if plt is None:
+        try:
+            # Import matplot lib but avoid default X environment
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot
+            plt = matplotlib.pyplot
+        except Exception as e:
+            # MatPlotLib can break in a variety of ways. Fake an error message and continue without it if so.
+            # The lack of the library will be handled when plots are attempted
+            print("##### ERROR! MatPlotLib library could not be loaded!    #####", file=sys.stderr)
+            print("##### Flat plots will instead be plotted as interactive #####", file=sys.stderr)
+            print(e)
+            plt = False
+    if plt is False:
+        raise ImportError("MatPlotLib could not be loaded")
 
 letters = 'abcdefghijklmnopqrstuvwxyz'
 
 # Load the template so that we can access its configuration
 # Do this lazily to mitigate import-spaghetti when running unit tests
-_template_mod = None
+_template_mods = dict()
 def get_template_mod():
-    global _template_mod
-    if not _template_mod:
-        _template_mod = config.avail_templates[config.template].load()
-    return _template_mod
+    if config.template not in _template_mods:
+        _template_mods[config.template] = config.avail_templates[config.template].load()
+    return _template_mods[config.template]
 
+@profiling.timed_plot('linegraph')
 def plot (data, pconfig=None):
     """ Plot a line graph with X,Y data.
     :param data: 2D dict, first keys as sample names, then x:y data pairs
@@ -221,6 +230,7 @@ def matplotlib_linegraph (plotdata, pconfig=None):
     """
     if pconfig is None:
         pconfig = {}
+    load_matplotlib()
 
     # Plot group ID
     if pconfig.get('id') is None:
@@ -5,12 +5,13 @@
 import logging
 import random
 
-from multiqc.utils import report
+from multiqc.utils import report, profiling
 
 logger = logging.getLogger(__name__)
 
 letters = 'abcdefghijklmnopqrstuvwxyz'
 
+@profiling.timed_plot('scatter')
 def plot (data, pconfig=None):
     """ Plot a scatter plot with X,Y data.
     :param data: 2D dict, first keys as sample names, then x:y data pairs
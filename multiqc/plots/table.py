@@ -3,15 +3,17 @@
 """ MultiQC functions to plot a table """
 
 from collections import defaultdict, OrderedDict
+import functools
 import logging
 import random
 
-from multiqc.utils import config, report, util_functions, mqc_colour
+from multiqc.utils import config, report, util_functions, mqc_colour, profiling
 from multiqc.plots import table_object, beeswarm
 logger = logging.getLogger(__name__)
 
 letters = 'abcdefghijklmnopqrstuvwxyz'
 
+@profiling.timed_plot('table')
 def plot (data, headers=None, pconfig=None):
     """ Return HTML for a MultiQC table.
     :param data: 2D dict, first keys as sample names, then x:y data pairs
@@ -62,9 +64,31 @@ def make_table (dt):
     if table_title is None:
         table_title = table_id.replace("_", " ").title()
 
+    # This is horrible, but Python locale settings are worse
+    if config.thousandsSep_format is None:
+        config.thousandsSep_format = '<span class="mqc_thousandSep"></span>'
+    if config.decimalPoint_format is None:
+        config.decimalPoint_format = '.'
+    decimal_point = config.decimalPoint_format
+    thousands_sep = config.thousandsSep_format
+
     for idx, k, header in dt.get_headers_in_order():
 
         rid = header['rid']
+        kname = '{}_{}'.format(header['namespace'], rid)
+        modify = header['modify'] if callable(header.get('modify')) else None
+
+        # Get the values for the column and format them all, once
+        cells = list()
+        for (s_name, samp) in dt.data[idx].items():
+            if k in samp:
+                val = samp[k]
+                dt.raw_vals[s_name][kname] = val
+                if modify is not None:
+                    val = modify(val)
+                cells.append((s_name, val))
+        format_value = value_formatter(header['format'])
+        valstrings = [format_value(val) for s_name, val in cells]
 
         # Build the table header cell
         shared_key = ''
@@ -108,25 +132,7 @@ def make_table (dt):
         else:
 
             # Find the value with the longest length to decide how much space a column should extend
-            values = []
-            for samp in dt.data[idx].values():
-                if k in samp:
-                    val = samp[k]
-
-                    # Apply the custom configuration on the decimal numbers
-                    if 'modify' in header and callable(header['modify']):
-                        val = header['modify'](val)
-                    try:
-                        valstring = str(header['format'].format(val))
-                    except ValueError:
-                        try:
-                            valstring = str(header['format'].format(float(val)))
-                        except ValueError:
-                            valstring = str(val)
-                    except:
-                        valstring = str(val)
-
-                    values.append(valstring.replace(",", ""))
+            values = [valstring.replace(",", "") for valstring in valstrings]
            
             max_len = len(max(values, key=len)) + len(max(values, key=len)) / 3 # since a space will be added between every set of three digits
             if ((max_len-len(header['title'])) > 0):
@@ -168,110 +174,62 @@ def make_table (dt):
                 sk = header.get('shared_key', '')
             )
 
-        # Make a colour scale
+        # Make a colour scale and work out all of the colours at once
         if header['scale'] == False:
             c_scale = None
+            colours = [None] * len(cells)
         else:
             c_scale = mqc_colour.mqc_colour_scale(header['scale'], header['dmin'], header['dmax'])
+            colours = c_scale.get_colour_list([val for s_name, val in cells])
+
+        # Everything that is the same for each cell in the column
+        cond_formatting = cond_formatting_rules(rid)
+        suffix = header.get('suffix', '')
+        dmin = header['dmin']
+        dmax = header['dmax']
+        if not header['scale']:
+            td_start = '<td class="{rid} {h}">'.format(rid=rid, h=hide)
+        else:
+            td_start = '<td class="data-coloured {rid} {h}"><div class="wrapper"><span class="bar" style="width:'.format(rid=rid, h=hide)
 
         # Add the data table cells
-        for (s_name, samp) in dt.data[idx].items():
-            if k in samp:
-                val = samp[k]
+        for (s_name, val), valstring, colour in zip(cells, valstrings, colours):
 
-                kname = '{}_{}'.format(header['namespace'], rid)
-                dt.raw_vals[s_name][kname] = val
+            valstring = valstring.replace('.', 'DECIMAL').replace(',', 'THOUSAND')
+            valstring = valstring.replace('DECIMAL', decimal_point).replace('THOUSAND', thousands_sep)
+
+            # Percentage suffixes etc
+            valstring += suffix
 
-                if 'modify' in header and callable(header['modify']):
-                    val = header['modify'](val)
+            # Conditional formatting
+            if cond_formatting is not None:
+                bgcol = cond_formatting_colour(val, cond_formatting)
+                if bgcol is not None:
+                    valstring = '<span class="badge" style="background-color:{}">{}</span>'.format(bgcol, valstring)
 
+            # Build HTML
+            if not header['scale']:
+                cell = ''.join([td_start, valstring, '</td>'])
+            else:
                 try:
-                    dmin = header['dmin']
-                    dmax = header['dmax']
                     # slightly reduce the percentage of colors to add some small gap between values
-                    percentage = (((float(val) - dmin) / (dmax - dmin)) * 100) - 2 
+                    percentage = (((float(val) - dmin) / (dmax - dmin)) * 100) - 2
                     percentage = min(percentage, 100)
                     percentage = max(percentage, 0)
                 except (ZeroDivisionError,ValueError):
                     percentage = 0
-
-                try:
-                    valstring = str(header['format'].format(val))
-                except ValueError:
-                    try:
-                        valstring = str(header['format'].format(float(val)))
-                    except ValueError:
-                        valstring = str(val)
-                except:
-                    valstring = str(val)
-
-                # This is horrible, but Python locale settings are worse
-                if config.thousandsSep_format is None:
-                    config.thousandsSep_format = '<span class="mqc_thousandSep"></span>'
-                if config.decimalPoint_format is None:
-                    config.decimalPoint_format = '.'
-                valstring = valstring.replace('.', 'DECIMAL').replace(',', 'THOUSAND')
-                valstring = valstring.replace('DECIMAL', config.decimalPoint_format).replace('THOUSAND', config.thousandsSep_format)
-
-                # Percentage suffixes etc
-                valstring += header.get('suffix', '')
-
-                # Conditional formatting
-                cmatches = { cfck: False for cfc in config.table_cond_formatting_colours for cfck in cfc }
-                # Find general rules followed by column-specific rules
-                for cfk in ['all_columns', rid]:
-                    if cfk in config.table_cond_formatting_rules:
-                        # Loop through match types
-                        for ftype in cmatches.keys():
-                            # Loop through array of comparison types
-                            for cmp in config.table_cond_formatting_rules[cfk].get(ftype, []):
-                                try:
-                                    # Each comparison should be a dict with single key: val
-                                    if 's_eq' in cmp and str(cmp['s_eq']).lower() == str(val).lower():
-                                        cmatches[ftype] = True
-                                    if 's_contains' in cmp and str(cmp['s_contains']).lower() in str(val).lower():
-                                        cmatches[ftype] = True
-                                    if 's_ne' in cmp and str(cmp['s_ne']).lower() != str(val).lower():
-                                        cmatches[ftype] = True
-                                    if 'eq' in cmp and float(cmp['eq']) == float(val):
-                                        cmatches[ftype] = True
-                                    if 'ne' in cmp and float(cmp['ne']) != float(val):
-                                        cmatches[ftype] = True
-                                    if 'gt' in cmp and float(cmp['gt']) < float(val):
-                                        cmatches[ftype] = True
-                                    if 'lt' in cmp and float(cmp['lt']) > float(val):
-                                        cmatches[ftype] = True
-                                except:
-                                    logger.warn("Not able to apply table conditional formatting to '{}' ({})".format(val, cmp))
-                # Apply HTML in order of config keys
-                bgcol = None
-                for cfc in config.table_cond_formatting_colours:
-                    for cfck in cfc: # should always be one, but you never know
-                        if cmatches[cfck]:
-                            bgcol = cfc[cfck]
-                if bgcol is not None:
-                    valstring = '<span class="badge" style="background-color:{}">{}</span>'.format(bgcol, valstring)
-
-                # Build HTML
-                if not header['scale']:
-                    if s_name not in t_rows:
-                        t_rows[s_name] = dict()
-                    t_rows[s_name][rid] = '<td class="{rid} {h}">{v}</td>'.format(rid=rid, h=hide, v=valstring)
+                if c_scale is not None:
+                    col = ' background-color:{};'.format(colour)
                 else:
-                    if c_scale is not None:
-                        col = ' background-color:{};'.format(c_scale.get_colour(val))
-                    else:
-                        col = ''
-                    bar_html = '<span class="bar" style="width:{}%;{}"></span>'.format(percentage, col)
-                    val_html = '<span class="val">{}</span>'.format(valstring)
-                    wrapper_html = '<div class="wrapper">{}{}</div>'.format(bar_html, val_html)
-
-                    if s_name not in t_rows:
-                        t_rows[s_name] = dict()
-                    t_rows[s_name][rid] = '<td class="data-coloured {rid} {h}">{c}</td>'.format(rid=rid, h=hide, c=wrapper_html)
+                    col = ''
+                cell = ''.join([td_start, str(percentage), '%;', col, '"></span><span class="val">', valstring, '</span></div></td>'])
+
+            if s_name not in t_rows:
+                t_rows[s_name] = dict()
+            t_rows[s_name][rid] = cell
 
         # Remove header if we don't have any filled cells for it
-        if sum([len(rows) for rows in t_rows.values()]) == 0:
+        if len(t_rows) == 0:
             t_headers.pop(rid, None)
             t_modal_headers.pop(rid, None)
             logger.debug('Removing header {} from general stats table, as no data'.format(k))
@@ -281,76 +239,75 @@ def make_table (dt):
     #
 
     # Buttons above the table
-    html = ''
+    html = list()
     if not config.simple_output:
 
         # Copy Table Button
-        html += """
+        html.append("""
         <button type="button" class="mqc_table_copy_btn btn btn-default btn-sm" data-clipboard-target="#{tid}">
             <span class="glyphicon glyphicon-copy"></span> Copy table
         </button>
-        """.format(tid=table_id)
+        """.format(tid=table_id))
 
         # Configure Columns Button
         if len(t_headers) > 1:
-            html += """
+            html.append("""
             <button type="button" class="mqc_table_configModal_btn btn btn-default btn-sm" data-toggle="modal" data-target="#{tid}_configModal">
                 <span class="glyphicon glyphicon-th"></span> Configure Columns
             </button>
-            """.format(tid=table_id)
+            """.format(tid=table_id))
 
         # Sort By Highlight button
-        html += """
+        html.append("""
         <button type="button" class="mqc_table_sortHighlight btn btn-default btn-sm" data-target="#{tid}" data-direction="desc" style="display:none;">
             <span class="glyphicon glyphicon-sort-by-attributes-alt"></span> Sort by highlight
         </button>
-        """.format(tid=table_id)
+        """.format(tid=table_id))
 
         # Scatter Plot Button
         if len(t_headers) > 1:
-            html += """
+            html.append("""
             <button type="button" class="mqc_table_makeScatter btn btn-default btn-sm" data-toggle="modal" data-target="#tableScatterModal" data-table="#{tid}">
                 <span class="glyphicon glyphicon glyphicon-stats"></span> Plot
             </button>
-            """.format(tid=table_id)
+            """.format(tid=table_id))
 
         # "Showing x of y columns" text
-        html += """
+        html.append("""
         <small id="{tid}_numrows_text" class="mqc_table_numrows_text">Showing <sup id="{tid}_numrows" class="mqc_table_numrows">{nrows}</sup>/<sub>{nrows}</sub> rows and <sup id="{tid}_numcols" class="mqc_table_numcols">{ncols_vis}</sup>/<sub>{ncols}</sub> columns.</small>
-        """.format(tid=table_id, nrows=len(t_rows), ncols_vis = (len(t_headers)+1)-hidden_cols, ncols=len(t_headers))
+        """.format(tid=table_id, nrows=len(t_rows), ncols_vis = (len(t_headers)+1)-hidden_cols, ncols=len(t_headers)))
 
     # Build the table itself
     collapse_class = 'mqc-table-collapse' if len(t_rows) > 10 and config.collapse_tables else ''
-    html += """
+    html.append("""
         <div id="{tid}_container" class="mqc_table_container">
             <div class="table-responsive mqc-table-responsive {cc}">
                 <table id="{tid}" class="table table-condensed mqc_table" data-title="{title}">
-        """.format( tid=table_id, title=table_title, cc=collapse_class)
+        """.format( tid=table_id, title=table_title, cc=collapse_class))
 
     # Build the header row
     col1_header = dt.pconfig.get('col1_header', 'Sample Name')
-    html += '<thead><tr><th class="rowheader">{}</th>{}</tr></thead>'.format(col1_header, ''.join(t_headers.values()))
+    html.append('<thead><tr><th class="rowheader">{}</th>{}</tr></thead>'.format(col1_header, ''.join(t_headers.values())))
 
     # Build the table body
-    html += '<tbody>'
+    html.append('<tbody>')
     t_row_keys = t_rows.keys()
     if dt.pconfig.get('sortRows') is not False:
         t_row_keys = sorted(t_row_keys)
     for s_name in t_row_keys:
-        html += '<tr>'
         # Sample name row header
-        html += '<th class="rowheader" data-original-sn="{sn}">{sn}</th>'.format(sn=s_name)
-        for k in t_headers:
-            html += t_rows[s_name].get(k, empty_cells[k])
-        html += '</tr>'
-    html += '</tbody></table></div>'
+        html.append('<tr><th class="rowheader" data-original-sn="{sn}">{sn}</th>'.format(sn=s_name))
+        row = t_rows[s_name]
+        html.extend([row.get(k, empty_cells[k]) for k in t_headers])
+        html.append('</tr>')
+    html.append('</tbody></table></div>')
     if len(t_rows) > 10 and config.collapse_tables:
-        html += '<div class="mqc-table-expand"><span class="glyphicon glyphicon-chevron-down" aria-hidden="true"></span></div>'
-    html += '</div>'
+        html.append('<div class="mqc-table-expand"><span class="glyphicon glyphicon-chevron-down" aria-hidden="true"></span></div>')
+    html.append('</div>')
 
     # Build the bootstrap modal to customise columns and order
     if not config.simple_output:
-        html += """
+        html.append("""
     <!-- MultiQC Table Columns Modal -->
     <div class="modal fade" id="{tid}_configModal" tabindex="-1">
       <div class="modal-dialog modal-lg">
@@ -383,7 +340,7 @@ def make_table (dt):
             </table>
         </div>
         <div class="modal-footer"> <button type="button" class="btn btn-default" data-dismiss="modal">Close</button> </div>
-    </div> </div> </div>""".format( tid=table_id, title=table_title, trows=''.join(t_modal_headers.values()) )
+    </div> </div> </div>""".format( tid=table_id, title=table_title, trows=''.join(t_modal_headers.values()) ))
 
     # Save the raw values to a file if requested
     if dt.pconfig.get('save_file') is True:
@@ -391,4 +348,99 @@ def make_table (dt):
         util_functions.write_data_file(dt.raw_vals, fn )
         report.saved_raw_data[fn] = dt.raw_vals
 
-    return html
+    return ''.join(html)
+
+
+def value_formatter(fmt):
+    """
+    Returns a function that formats the values of a column for the table cells,
+    using fmt, such as '{:,.1f}'. Values that don't fit the format are formatted
+    as floats if they can be, otherwise they're just made into strings.
+    """
+    try:
+        fmt_value = fmt.format
+    except AttributeError:
+        return str
+    def format_value(val):
+        try:
+            return str(fmt_value(val))
+        except ValueError:
+            try:
+                return str(fmt_value(float(val)))
+            except ValueError:
+                return str(val)
+        except Exception:
+            return str(val)
+    return format_value
+
+# Conditional formatting comparisons other than s_eq, in the order that they're
+# tested. Each has a function to read the config value, and a test for a table
+# value against the config value that raises an exception if it can't be applied
+cond_formatting_tests = [
+    ('s_contains', lambda c: str(c).lower(), lambda c, val: c in str(val).lower()),
+    ('s_ne',       lambda c: str(c).lower(), lambda c, val: c != str(val).lower()),
+    ('eq',         float,                    lambda c, val: c == float(val)),
+    ('ne',         float,                    lambda c, val: c != float(val)),
+    ('gt',         float,                    lambda c, val: c < float(val)),
+    ('lt',         float,                    lambda c, val: c > float(val))
+]
+
+def cond_formatting_error(val):
+    """ Test for a comparison that couldn't be read from the config """
+    raise ValueError("Conditional formatting comparison can't be applied")
+
+def cond_formatting_rules(rid):
+    """
+    Read the conditional formatting rules for a column from config.table_cond_formatting_rules,
+    the rules for all columns followed by those for the column, so that they don't have to be
+    looked up for every cell. Returns None if there are none. Otherwise returns a tuple of a dict
+    of the lower case strings that s_eq comparisons match, with the set of match types for each,
+    a list of (match type, comparison, tests) for the other comparisons, and a list of
+    (match type, colour) from config.table_cond_formatting_colours.
+    """
+    colours = [(cfck, cfc[cfck]) for cfc in config.table_cond_formatting_colours for cfck in cfc]
+    ftypes = list(OrderedDict((cfck, True) for cfck, colour in colours))
+    s_eq = defaultdict(set)
+    comparisons = list()
+    for cfk in ['all_columns', rid]:
+        if cfk not in config.table_cond_formatting_rules:
+            continue
+        for ftype in ftypes:
+            for cmp in config.table_cond_formatting_rules[cfk].get(ftype, []):
+                tests = list()
+                try:
+                    # Each comparison should be a dict with single key: val
+                    if 's_eq' in cmp:
+                        s_eq[str(cmp['s_eq']).lower()].add(ftype)
+                    for ckey, read_value, test in cond_formatting_tests:
+                        if ckey in cmp:
+                            tests.append(functools.partial(test, read_value(cmp[ckey])))
+                except Exception:
+                    tests.append(cond_formatting_error)
+                if len(tests) > 0:
+                    comparisons.append((ftype, cmp, tests))
+    if len(s_eq) == 0 and len(comparisons) == 0:
+        return None
+    return dict(s_eq), comparisons, colours
+
+def cond_formatting_colour(val, rules):
+    """ Background colour for a value from the rules from cond_formatting_rules(), or None if it doesn't match any """
+    s_eq, comparisons, colours = rules
+    matches = s_eq.get(str(val).lower(), ())
+    if len(comparisons) > 0:
+        matches = set(matches)
+        for ftype, cmp, tests in comparisons:
+            try:
+                for test in tests:
+                    if test(val):
+                        matches.add(ftype)
+            except Exception:
+                logger.warn("Not able to apply table conditional formatting to '{}' ({})".format(val, cmp))
+    if len(matches) == 0:
+        return None
+    # Apply HTML in order of config keys
+    bgcol = None
+    for ftype, colour in colours:
+        if ftype in matches:
+            bgcol = colour
+    return bgcol
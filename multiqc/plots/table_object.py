@@ -61,17 +61,15 @@ class datatable (object):
                 cdata[str(k)] = v
             data[idx] = cdata
             for s_name in data[idx].keys():
+                if all(isinstance(k, str) for k in data[idx][s_name]):
+                    continue
                 for k in list(data[idx][s_name].keys()):
                     data[idx][s_name][str(k)] = data[idx][s_name].pop(k)
 
             # Check that we have some data in each column
             empties = list()
             for k in keys:
-                n = 0
-                for samp in d.values():
-                    if k in samp:
-                        n += 1
-                if n == 0:
+                if not any(k in samp for samp in d.values()):
                     empties.append(k)
             for k in empties:
                 keys = [j for j in keys if j != k]
@@ -151,21 +149,24 @@ class datatable (object):
                     headers[idx][k]['dmin'] = 0
                     setdmin = True
 
-                # Figure out the min / max if not supplied
+                # Figure out the min / max if not supplied, from one pass through the column
                 if setdmax or setdmin:
-                    for s_name, samp in data[idx].items():
+                    modify = headers[idx][k]['modify'] if callable(headers[idx][k]['modify']) else None
+                    vals = [0] # dmax and dmin both start at zero
+                    for samp in data[idx].values():
                         try:
                             val = float(samp[k])
-                            if callable(headers[idx][k]['modify']):
-                                val = float(headers[idx][k]['modify'](val))
-                            if setdmax:
-                                headers[idx][k]['dmax'] = max(headers[idx][k]['dmax'], val)
-                            if setdmin:
-                                headers[idx][k]['dmin'] = min(headers[idx][k]['dmin'], val)
+                            if modify is not None:
+                                val = float(modify(val))
+                            vals.append(val)
                         except ValueError:
-                            val = samp[k] # couldn't convert to float - keep as a string
+                            pass # couldn't convert to float - not a number
                         except KeyError:
                             pass # missing data - skip
+                    if setdmax:
+                        headers[idx][k]['dmax'] = max(vals)
+                    if setdmin:
+                        headers[idx][k]['dmin'] = min(vals)
                     # Limit auto-generated scales with floor, ceiling and minRange.
                     if headers[idx][k]['ceiling'] is not None and headers[idx][k]['max'] is None:
                         headers[idx][k]['dmax'] = min(headers[idx][k]['dmax'], float(headers[idx][k]['ceiling']))
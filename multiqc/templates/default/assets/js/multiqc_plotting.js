@@ -23,8 +23,17 @@ $(function () {
   // Show loading warning
   $('.mqc_loading_warning').show();
 
-  // Decompress the JSON plot data
-  mqc_plots = JSON.parse(LZString.decompressFromBase64(mqc_compressed_plotdata));
+  // Decompress the JSON plot data and unpack any columnar plots. Plots that were
+  // compressed separately are only decompressed when they are first used.
+  if(mqc_compressed_plotdata.length > 0){
+    mqc_plots = JSON.parse(mqc_decode_plotdata(mqc_compressed_plotdata, mqc_plotdata_encoding));
+    for(var id in mqc_plots){
+      mqc_plots[id] = mqc_unpack_plot(mqc_plots[id]);
+    }
+  }
+  for(var id in mqc_compressed_plotchunks){
+    mqc_lazy_plot(id);
+  }
 
   // HighCharts Defaults
   window.HCDefaults = $.extend(true, {}, Highcharts.getOptions(), {});
@@ -1555,4 +1564,265 @@ function highlight_fade_text(obj){
       'transition'       : 'background-color 0.5s, color 0.5s'
     });
   }, 500);
-}
\ No newline at end of file
+}
+////////////////////////////////////////////////
+// Plot data decoding
+////////////////////////////////////////////////
+
+// Decode the compressed plot data, using the function with the same name as
+// the encoding in report.plot_data_encoders. Each returns the JSON string.
+var mqc_plotdata_decoders = {
+  'lzstring': function(data){
+    return LZString.decompressFromBase64(data);
+  },
+  'zlib': function(data){
+    return mqc_utf8_decode(mqc_inflate(mqc_base64_decode(data)));
+  }
+};
+function mqc_decode_plotdata(data, encoding){
+  if(mqc_plotdata_decoders[encoding] === undefined){
+    throw new Error('Unknown plot data encoding: '+encoding);
+  }
+  return mqc_plotdata_decoders[encoding](data);
+}
+
+// Add a plot to mqc_plots that is decompressed from mqc_compressed_plotchunks the
+// first time that it is used. The compressed data is then dropped.
+function mqc_lazy_plot(id){
+  function set_plot(plot){
+    delete mqc_compressed_plotchunks[id];
+    Object.defineProperty(mqc_plots, id, { value: plot, writable: true, enumerable: true, configurable: true });
+  }
+  Object.defineProperty(mqc_plots, id, {
+    enumerable: true,
+    configurable: true,
+    get: function(){
+      var plot = JSON.parse(mqc_decode_plotdata(mqc_compressed_plotchunks[id], mqc_plotdata_encoding));
+      set_plot(mqc_unpack_plot(plot));
+      return mqc_plots[id];
+    },
+    set: set_plot
+  });
+}
+
+// Unpack a line graph or bar graph packed by columnar.pack_plot_data() into the
+// usual plot data. Packed series have the index of their name in 'n', their numbers
+// as [type, base64 floats] in 'y' and the index of their x values in 'x'. Packed
+// bar graph sample lists have the index of each name in 'n'.
+function mqc_unpack_plot(plot){
+  if(plot['packed'] === undefined){
+    return plot;
+  }
+  var names = plot['packed']['names'];
+  var xs = plot['packed']['xs'].map(function(x){ return mqc_decode_floats(x[0], x[1]); });
+  plot['datasets'] = plot['datasets'].map(function(dataset){
+    return dataset.map(function(s){
+      if(s['n'] === undefined){
+        return s;
+      }
+      var y = mqc_decode_floats(s['y'][0], s['y'][1]);
+      var x = s['x'] === undefined ? null : xs[s['x']];
+      var data = new Array(y.length);
+      for(var i = 0; i < y.length; i++){
+        var val = isNaN(y[i]) ? null : y[i];
+        data[i] = x === null ? val : [x[i], val];
+      }
+      var series = { 'name': names[s['n']], 'data': data };
+      for(var k in s){
+        if(k != 'n' && k != 'x' && k != 'y'){ series[k] = s[k]; }
+      }
+      return series;
+    });
+  });
+  if(plot['samples'] !== undefined){
+    plot['samples'] = plot['samples'].map(function(samples){
+      return samples['n'] === undefined ? samples : samples['n'].map(function(n){ return names[n]; });
+    });
+  }
+  delete plot['packed'];
+  return plot;
+}
+
+// Base64 little-endian 32 bit ('f4') or 64 bit ('f8') floats to a typed array
+var mqc_little_endian = new Uint8Array(new Uint16Array([1]).buffer)[0] == 1;
+function mqc_decode_floats(type, data){
+  var bytes = mqc_base64_decode(data);
+  var size = type == 'f4' ? 4 : 8;
+  if(mqc_little_endian){
+    return type == 'f4' ? new Float32Array(bytes.buffer) : new Float64Array(bytes.buffer);
+  }
+  var view = new DataView(bytes.buffer);
+  var values = new Float64Array(bytes.length / size);
+  for(var i = 0; i < values.length; i++){
+    values[i] = type == 'f4' ? view.getFloat32(i * size, true) : view.getFloat64(i * size, true);
+  }
+  return values;
+}
+
+// Base64 to a Uint8Array
+function mqc_base64_decode(data){
+  var bin = atob(data);
+  var bytes = new Uint8Array(bin.length);
+  for(var i = 0; i < bin.length; i++){
+    bytes[i] = bin.charCodeAt(i);
+  }
+  return bytes;
+}
+
+// UTF-8 Uint8Array to a string
+function mqc_utf8_decode(bytes){
+  if(window.TextDecoder !== undefined){
+    return new TextDecoder('utf-8').decode(bytes);
+  }
+  var s = '';
+  for(var i = 0; i < bytes.length; i += 0x8000){
+    s += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+  }
+  return decodeURIComponent(escape(s));
+}
+
+// Inflate a zlib stream (RFC 1950 / 1951) to a Uint8Array. Codes are decoded a bit
+// at a time with canonical Huffman tables, in the same way as zlib's puff.c
+var mqc_inflate_tables = {
+  len_base: [3,4,5,6,7,8,9,10,11,13,15,17,19,23,27,31,35,43,51,59,67,83,99,115,131,163,195,227,258],
+  len_extra: [0,0,0,0,0,0,0,0,1,1,1,1,2,2,2,2,3,3,3,3,4,4,4,4,5,5,5,5,0],
+  dist_base: [1,2,3,4,5,7,9,13,17,25,33,49,65,97,129,193,257,385,513,769,1025,1537,2049,3073,4097,6145,8193,12289,16385,24577],
+  dist_extra: [0,0,0,0,1,1,2,2,3,3,4,4,5,5,6,6,7,7,8,8,9,9,10,10,11,11,12,12,13,13],
+  code_order: [16,17,18,0,8,7,9,6,10,5,11,4,12,3,13,2,14,1,15]
+};
+function mqc_inflate(src){
+  var t = mqc_inflate_tables;
+  var out = new Uint8Array(Math.max(src.length * 4, 1024));
+  var out_len = 0;
+  var pos = 2; // Skip the zlib header
+  var bit_buf = 0;
+  var bit_cnt = 0;
+
+  function bits(n){
+    while(bit_cnt < n){
+      if(pos >= src.length){ throw new Error('Compressed plot data ended early'); }
+      bit_buf |= src[pos++] << bit_cnt;
+      bit_cnt += 8;
+    }
+    var val = bit_buf & ((1 << n) - 1);
+    bit_buf >>>= n;
+    bit_cnt -= n;
+    return val;
+  }
+  function grow(n){
+    if(out_len + n > out.length){
+      var bigger = new Uint8Array(Math.max(out.length * 2, out_len + n));
+      bigger.set(out.subarray(0, out_len));
+      out = bigger;
+    }
+  }
+  // Canonical Huffman table from a list of code lengths
+  function huffman(lengths){
+    var counts = new Uint16Array(16);
+    var offsets = new Uint16Array(16);
+    var symbols = new Uint16Array(lengths.length);
+    for(var i = 0; i < lengths.length; i++){ counts[lengths[i]]++; }
+    counts[0] = 0;
+    for(var i = 1; i < 16; i++){ offsets[i] = offsets[i-1] + counts[i-1]; }
+    for(var i = 0; i < lengths.length; i++){
+      if(lengths[i] > 0){ symbols[offsets[lengths[i]]++] = i; }
+    }
+    return { counts: counts, symbols: symbols };
+  }
+  function decode(h){
+    var code = 0, first = 0, index = 0;
+    for(var len = 1; len < 16; len++){
+      code |= bits(1);
+      var count = h.counts[len];
+      if(code - count < first){
+        return h.symbols[index + (code - first)];
+      }
+      index += count;
+      first = (first + count) << 1;
+      code <<= 1;
+    }
+    throw new Error('Bad code in compressed plot data');
+  }
+
+  var fixed_lit = null, fixed_dist = null;
+  var last = 0;
+  while(!last){
+    last = bits(1);
+    var type = bits(2);
+    if(type == 0){
+      // Stored block, starting at the next byte
+      bit_buf = 0;
+      bit_cnt = 0;
+      var len = src[pos] | (src[pos+1] << 8);
+      pos += 4;
+      grow(len);
+      out.set(src.subarray(pos, pos + len), out_len);
+      out_len += len;
+      pos += len;
+      continue;
+    }
+    var lit, dist;
+    if(type == 1){
+      if(fixed_lit === null){
+        var lengths = [];
+        for(var i = 0; i < 288; i++){ lengths.push(i < 144 ? 8 : (i < 256 ? 9 : (i < 280 ? 7 : 8))); }
+        fixed_lit = huffman(lengths);
+        lengths = [];
+        for(var i = 0; i < 30; i++){ lengths.push(5); }
+        fixed_dist = huffman(lengths);
+      }
+      lit = fixed_lit;
+      dist = fixed_dist;
+    } else if(type == 2){
+      var num_lit = bits(5) + 257;
+      var num_dist = bits(5) + 1;
+      var num_code = bits(4) + 4;
+      var lengths = [];
+      for(var i = 0; i < 19; i++){ lengths.push(0); }
+      for(var i = 0; i < num_code; i++){ lengths[t.code_order[i]] = bits(3); }
+      var code_table = huffman(lengths);
+      lengths = [];
+      while(lengths.length < num_lit + num_dist){
+        var sym = decode(code_table);
+        if(sym < 16){
+          lengths.push(sym);
+        } else {
+          var val = 0, rep;
+          if(sym == 16){
+            val = lengths[lengths.length - 1];
+            rep = 3 + bits(2);
+          } else if(sym == 17){
+            rep = 3 + bits(3);
+          } else {
+            rep = 11 + bits(7);
+          }
+          while(rep--){ lengths.push(val); }
+        }
+      }
+      lit = huffman(lengths.slice(0, num_lit));
+      dist = huffman(lengths.slice(num_lit));
+    } else {
+      throw new Error('Bad block type in compressed plot data');
+    }
+    // Literals and back references, up to the end of block code
+    while(true){
+      var sym = decode(lit);
+      if(sym < 256){
+        grow(1);
+        out[out_len++] = sym;
+      } else if(sym == 256){
+        break;
+      } else {
+        sym -= 257;
+        var len = t.len_base[sym] + bits(t.len_extra[sym]);
+        var d = decode(dist);
+        var from = out_len - (t.dist_base[d] + bits(t.dist_extra[d]));
+        grow(len);
+        for(var i = 0; i < len; i++){
+          out[out_len++] = out[from + i];
+        }
+      }
+    }
+  }
+  return out.subarray(0, out_len);
+}
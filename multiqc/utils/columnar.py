@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+""" MultiQC columnar plot data. Packs the data for line graphs and bar graphs
+into a compact form for the report, with the numbers of each series saved as
+a base64 string of little-endian floats instead of a JSON list. X values shared
+by several series are saved once, and sample names are saved once per plot.
+multiqc_plotting.js unpacks these back into the usual plot data when the
+report is loaded. """
+
+from __future__ import print_function
+import base64
+import numbers
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str # Python 3
+
+def pack_plot_data(plot_data):
+    """
+    Returns a copy of report.plot_data with the line graphs and bar graphs
+    packed. Other plots, and any series that can't be packed (such as those
+    with text x values), are left as they are.
+    """
+    packed = dict()
+    for pid, plot in plot_data.items():
+        try:
+            packer = plot_packers.get(plot.get('plot_type'))
+        except AttributeError:
+            packer = None
+        packed[pid] = plot if packer is None else packer(plot)
+    return packed
+
+def pack_line_graph(plot):
+    """ Pack a plot made by linegraph.highcharts_linegraph() """
+    p = PlotPacker()
+    datasets = list()
+    for dataset in plot['datasets']:
+        datasets.append([p.pack_series(s, xy=True) for s in dataset])
+    packed = dict(plot, datasets=datasets)
+    packed['packed'] = p.header()
+    return packed
+
+def pack_bar_graph(plot):
+    """ Pack a plot made by bargraph.highcharts_bargraph() """
+    p = PlotPacker()
+    datasets = list()
+    for dataset in plot['datasets']:
+        datasets.append([p.pack_series(s, xy=False) for s in dataset])
+    samples = list()
+    for names in plot['samples']:
+        if all(isinstance(n, string_types) for n in names):
+            samples.append({'n': [p.name_index(n) for n in names]})
+        else:
+            samples.append(names)
+    packed = dict(plot, datasets=datasets, samples=samples)
+    packed['packed'] = p.header()
+    return packed
+
+plot_packers = {
+    'xy_line': pack_line_graph,
+    'bar_graph': pack_bar_graph
+}
+
+class PlotPacker(object):
+    """
+    Packs the series of one plot, keeping the list of sample names and
+    x values that they use.
+    """
+
+    def __init__(self):
+        self.names = list()
+        self.name_indexes = dict()
+        self.xs = list()
+        self.x_indexes = dict()
+
+    def header(self):
+        """ The names and x values, to be saved in the plot as 'packed' """
+        return {'names': self.names, 'xs': self.xs}
+
+    def name_index(self, name):
+        if name not in self.name_indexes:
+            self.name_indexes[name] = len(self.names)
+            self.names.append(name)
+        return self.name_indexes[name]
+
+    def x_index(self, x):
+        if x not in self.x_indexes:
+            self.x_indexes[x] = len(self.xs)
+            self.xs.append(x)
+        return self.x_indexes[x]
+
+    def pack_series(self, series, xy):
+        """
+        Pack a series dict with a 'name' and 'data'. If xy is True, the data
+        can be [x, y] pairs, otherwise it must be a list of numbers. Returns
+        the series unchanged if it can't be packed.
+        """
+        try:
+            name = series['name']
+            data = series['data']
+        except (KeyError, TypeError):
+            return series
+        if not isinstance(name, string_types) or not isinstance(data, list):
+            return series
+        x = None
+        if xy and len(data) > 0 and isinstance(data[0], list):
+            if not all(isinstance(d, list) and len(d) == 2 for d in data):
+                return series
+            xs, ys = zip(*data)
+            x = to_floats(xs, allow_none=False)
+            if x is None:
+                return series
+            x = encode_floats(x)
+            y = to_floats(ys)
+        else:
+            y = to_floats(data)
+        if y is None:
+            return series
+        packed = dict((k, v) for k, v in series.items() if k not in ('name', 'data'))
+        packed['n'] = self.name_index(name)
+        packed['y'] = encode_floats(y)
+        if x is not None:
+            packed['x'] = self.x_index(x)
+        return packed
+
+def to_floats(values, allow_none=True):
+    """
+    Convert a list of numbers to a float array, with NaN for any that are
+    None if allow_none. Returns None if there is anything else in the list.
+    """
+    import numpy as np
+    try:
+        a = np.array(values)
+    except ValueError:
+        return None
+    if a.ndim != 1:
+        return None
+    if a.dtype.kind in 'iuf':
+        return a.astype('<f8')
+    if a.dtype.kind != 'O':
+        return None
+    # Numbers mixed with None, or numbers too big for NumPy ints
+    for v in values:
+        if v is None:
+            if not allow_none:
+                return None
+        elif isinstance(v, bool) or not isinstance(v, numbers.Real):
+            return None
+    return np.array([float('nan') if v is None else v for v in values], dtype='<f8')
+
+def encode_floats(a):
+    """
+    Encode a float array as a tuple of the type and the base64 string of its
+    bytes. Uses 32 bit floats if every number fits exactly, otherwise 64 bit.
+    """
+    import numpy as np
+    with np.errstate(over='ignore'):
+        a32 = a.astype('<f4')
+    if ((a32 == a) | np.isnan(a)).all():
+        return ('f4', base64.b64encode(a32.tobytes()).decode('ascii'))
+    return ('f8', base64.b64encode(a.tobytes()).decode('ascii'))
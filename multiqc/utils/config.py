@@ -7,8 +7,8 @@ from __future__ import print_function
 from datetime import datetime
 import inspect
 import collections
+import copy
 import os
-import pkg_resources
 import subprocess
 import sys
 import yaml
@@ -19,36 +19,116 @@ import multiqc
 import logging
 logger = logging.getLogger(__name__)
 
-# Get the MultiQC version
-version = pkg_resources.get_distribution("multiqc").version
-short_version = pkg_resources.get_distribution("multiqc").version
+##### Entry points
+# Use importlib.metadata where we can, as pkg_resources is slow to import
+try:
+    import importlib.metadata as importlib_metadata
+except ImportError:
+    importlib_metadata = None
+
+def iter_entry_points(group):
+    """ Find all installed entry points in a group, without loading them """
+    if importlib_metadata is None:
+        import pkg_resources
+        return list(pkg_resources.iter_entry_points(group))
+    entry_points = importlib_metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        entry_points = entry_points.select(group=group)
+    else:
+        entry_points = entry_points.get(group, [])
+    # A package can be found more than once if it's on the path twice
+    found = list()
+    for entry_point in entry_points:
+        if entry_point not in found:
+            found.append(entry_point)
+    return found
+
+# Get the MultiQC version. The git commit is added by get_git_hash()
+if importlib_metadata is None:
+    import pkg_resources
+    version = pkg_resources.get_distribution("multiqc").version
+else:
+    version = importlib_metadata.version("multiqc")
+short_version = version
 script_path = os.path.dirname(os.path.realpath(__file__))
 git_hash = None
 git_hash_short = None
-try:
-    git_hash = subprocess.check_output( ['git', 'rev-parse', 'HEAD'],
-                                        cwd=script_path,
-                                        stderr=subprocess.STDOUT,
-                                        universal_newlines=True ).strip()
-    git_hash_short = git_hash[:7]
-    version = '{} ({})'.format(version, git_hash_short)
-except:
-    pass
+_git_hash = False # Not looked for yet
+
+def _read_git_head(path):
+    """
+    Read the commit checked out in the git repository holding path straight
+    from its .git directory, so that git doesn't need to be run. Returns False
+    if the .git directory is laid out in a way that this can't follow, and
+    None if path isn't in a git repository at all.
+    """
+    while True:
+        git_dir = os.path.join(path, '.git')
+        if os.path.exists(git_dir):
+            break
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    if not os.path.isdir(git_dir):
+        return False # Worktree or submodule, where .git is a file
+    try:
+        with open(os.path.join(git_dir, 'HEAD')) as fh:
+            head = fh.read().strip()
+        if not head.startswith('ref: '):
+            return head # Detached HEAD
+        ref = head[5:]
+        if os.path.isfile(os.path.join(git_dir, ref)):
+            with open(os.path.join(git_dir, ref)) as fh:
+                return fh.read().strip()
+        with open(os.path.join(git_dir, 'packed-refs')) as fh:
+            for l in fh:
+                s = l.split()
+                if len(s) == 2 and s[1] == ref:
+                    return s[0]
+    except (IOError, OSError):
+        pass
+    return False
+
+def get_git_hash():
+    """
+    Find the git commit of this copy of MultiQC, if it's running from a git
+    repository, and add it to the version. Only looks the first time in each
+    process, and only runs git if the commit can't be read from the .git directory.
+    """
+    global _git_hash, git_hash, git_hash_short, version
+    if _git_hash is False:
+        _git_hash = _read_git_head(script_path)
+    if _git_hash is False:
+        try:
+            _git_hash = subprocess.check_output( ['git', 'rev-parse', 'HEAD'],
+                                                cwd=script_path,
+                                                stderr=subprocess.STDOUT,
+                                                universal_newlines=True ).strip()
+        except:
+            _git_hash = None
+    if _git_hash is not None:
+        git_hash = _git_hash
+        git_hash_short = git_hash[:7]
+        version = '{} ({})'.format(short_version, git_hash_short)
+    return git_hash
 
 # Constants
 MULTIQC_DIR = os.path.dirname(os.path.realpath(inspect.getfile(multiqc)))
 
 ##### MultiQC Defaults
+# Use the much faster C YAML parser for the defaults, if it's installed
+_yaml_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 # Default MultiQC config
 searchp_fn = os.path.join( MULTIQC_DIR, 'utils', 'config_defaults.yaml')
 with open(searchp_fn) as f:
-    configs = yaml.load(f)
+    configs = yaml.load(f, Loader=_yaml_loader)
     for c, v in configs.items():
         globals()[c] = v
 # Module filename search patterns
 searchp_fn = os.path.join( MULTIQC_DIR, 'utils', 'search_patterns.yaml')
 with open(searchp_fn) as f:
-    sp = yaml.load(f)
+    sp = yaml.load(f, Loader=_yaml_loader)
 
 # Other defaults that can't be set in YAML
 data_tmp_dir = '/tmp' # will be overwritten by core script
@@ -63,16 +143,16 @@ megaqc_access_token = os.environ.get('MEGAQC_ACCESS_TOKEN')
 # Modules must be listed in setup.py under entry_points['multiqc.modules.v1']
 # Get all modules, including those from other extension packages
 avail_modules = dict()
-for entry_point in pkg_resources.iter_entry_points('multiqc.modules.v1'):
-    nicename = str(entry_point).split('=')[0].strip()
+for entry_point in iter_entry_points('multiqc.modules.v1'):
+    nicename = entry_point.name
     avail_modules[nicename] = entry_point
 
 ##### Available templates
 # Templates must be listed in setup.py under entry_points['multiqc.templates.v1']
 # Get all templates, including those from other extension packages
 avail_templates = {}
-for entry_point in pkg_resources.iter_entry_points('multiqc.templates.v1'):
-    nicename = str(entry_point).split('=')[0].strip()
+for entry_point in iter_entry_points('multiqc.templates.v1'):
+    nicename = entry_point.name
     avail_templates[nicename] = entry_point
 
 ##### Check we have modules & templates
@@ -218,3 +298,32 @@ def update_dict(d, u):
         else:
             d[key] = u[key]
     return d
+
+##### Reset the config between runs, so that MultiQC can be run more than once in the same process
+# Config that was there before the first run, set by the first call to reset()
+defaults = None
+default_names = None
+reset_skip = ('defaults', 'default_names', 'reset_skip', 'logger', 'avail_modules', 'avail_templates', 'configs')
+def reset():
+    """
+    Put the config back to how it was before the first run, dropping anything
+    loaded from config files or set on the command line or by plugins since.
+    The first call saves the config as it is now, for later calls to go back to.
+    """
+    global defaults, default_names, creation_date, working_dir, analysis_dir, output_dir
+    g = globals()
+    plain_types = (dict, list, tuple, set, str, int, float, bool, type(None))
+    if defaults is None:
+        default_names = set(g.keys())
+        defaults = dict((k, copy.deepcopy(v)) for k, v in g.items() if
+                        not k.startswith('_') and k not in reset_skip and isinstance(v, plain_types))
+    else:
+        for k in list(g.keys()):
+            if k not in default_names:
+                del g[k]
+        g.update(copy.deepcopy(defaults))
+    # Defaults that depend on when and where MultiQC is run
+    creation_date = datetime.now().strftime("%Y-%m-%d, %H:%M")
+    working_dir = os.getcwd()
+    analysis_dir = [os.getcwd()]
+    output_dir = os.path.realpath(os.getcwd())
@@ -14,6 +14,7 @@ from multiqc.utils import config, util_functions
 LEVELS = {0: 'INFO', 1: 'DEBUG'}
 log_tmp_dir = None
 log_tmp_fn = '/dev/null'
+log_handlers = list()
 
 def init_log(logger, loglevel=0):
     """
@@ -25,6 +26,12 @@ def init_log(logger, loglevel=0):
     Args:
         loglevel (str): Determines the level of the log output.
     """
+    # Remove the handlers from an earlier run in this process
+    for handler in log_handlers:
+        logger.removeHandler(handler)
+        handler.close()
+    del log_handlers[:]
+
     # File for logging
     global log_tmp_dir, log_tmp_fn
     log_tmp_dir = tempfile.mkdtemp()
@@ -45,12 +52,14 @@ def init_log(logger, loglevel=0):
     else:
         console.setFormatter(logging.Formatter(info_template))
     logger.addHandler(console)
+    log_handlers.append(console)
 
     # Now set up the file logging stream if we have a data directory
     file_handler = logging.FileHandler(log_tmp_fn, encoding='utf-8')
     file_handler.setLevel(getattr(logging, 'DEBUG')) # always DEBUG for the file
     file_handler.setFormatter(logging.Formatter(debug_template))
     logger.addHandler(file_handler)
+    log_handlers.append(file_handler)
 
 def move_tmp_log(logger):
     """ Move the temporary log file to the MultiQC data directory
@@ -7,7 +7,6 @@ import gzip
 import io
 import json
 import os
-import requests
 
 from multiqc import config
 log = config.logger
@@ -69,6 +68,7 @@ def multiqc_dump_json(report):
 
 
 def multiqc_api_post(exported_data):
+    import requests # Slow to import, so only when uploading
     headers = { 'Content-Type': 'application/json', 'content-encoding': 'gzip' }
     if config.megaqc_access_token is not None:
         headers['access_token'] = config.megaqc_access_token
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+""" MultiQC module runner. Runs each module, either one after another
+or in a pool of worker processes. Workers send back everything that
+their module added to the report, which is merged in module order so
+that the report is the same however the modules were run. """
+
+from __future__ import print_function
+from collections import defaultdict, OrderedDict
+import multiprocessing
+import pickle
+import traceback
+
+from multiqc.utils import report, config, profiling
+logger = config.logger
+
+# Modules to be run by the worker processes, and the HTML IDs used before
+# any modules were run. Set before the workers are forked, so that they only
+# need to be sent an index into this list.
+pool_modules = list()
+pool_html_ids = list()
+
+class ModuleOutput(object):
+    """
+    Lightweight copy of a finished module, with just the attributes that are
+    used to build the report. Sent back from worker processes instead of the
+    module itself, which can hold anything.
+    """
+    attributes = ['name', 'anchor', 'href', 'info', 'comment', 'extra', 'intro', 'sections', 'css', 'js']
+
+    def __init__(self, mod):
+        for a in self.attributes:
+            if hasattr(mod, a):
+                setattr(self, a, getattr(mod, a))
+
+class PrecomputedModify(object):
+    """
+    Picklable stand-in for a general statistics 'modify' function, which
+    are usually lambdas. Holds the result of the function for every value
+    in the column, so that the table is built in exactly the same way.
+    """
+
+    def __init__(self, modify, values):
+        self.results = dict()
+        for val in values:
+            for v in (val, self.to_float(val)):
+                try:
+                    self.results[v] = modify(v)
+                except Exception:
+                    pass
+
+    @staticmethod
+    def to_float(val):
+        try:
+            return float(val)
+        except (TypeError, ValueError):
+            return val
+
+    def __call__(self, val):
+        try:
+            return self.results[val]
+        except (KeyError, TypeError):
+            return val
+
+def plain(data):
+    """
+    Recursively convert defaultdicts (which usually have a lambda as their
+    default factory) to normal dicts, so that they can be pickled.
+    """
+    if isinstance(data, defaultdict):
+        return dict((k, plain(v)) for k, v in data.items())
+    if isinstance(data, OrderedDict):
+        return OrderedDict((k, plain(v)) for k, v in data.items())
+    if isinstance(data, dict):
+        return dict((k, plain(v)) for k, v in data.items())
+    if isinstance(data, list):
+        return [plain(v) for v in data]
+    return data
+
+def run_module(mod_dict):
+    """
+    Load and run a single module. Returns a status of 'ok', 'no_samples' or
+    'error', along with a list of the module objects that it returned.
+    """
+    this_module = list(mod_dict.keys())[0]
+    timer = profiling.Timer('module', this_module).start()
+    code_profiler = profiling.CodeProfiler().start() if config.profile_code else None
+    try:
+        mod_cust_config = list(mod_dict.values())[0]
+        mod = config.avail_modules[this_module].load()
+        mod.mod_cust_config = mod_cust_config # feels bad doing this, but seems to work
+        output = mod()
+        if type(output) != list:
+            output = [output]
+        return 'ok', output
+    except UserWarning:
+        logger.debug("No samples found: {}".format(this_module))
+        return 'no_samples', []
+    except KeyboardInterrupt:
+        raise
+    except:
+        # Flag the error, but carry on
+        logger.error("Oops! The '{}' MultiQC module broke... \n".format(this_module) + \
+                  "  Please copy the following traceback and report it at " + \
+                  "https://github.com/ewels/MultiQC/issues \n" + \
+                  "  If possible, please include a log file that triggers the error - " + \
+                  "the last file found was:\n" + \
+                  "    {}\n".format(report.last_found_file) + \
+                  ('='*60)+"\nModule {} raised an exception: {}".format(
+                      this_module, traceback.format_exc()) + ('='*60))
+        return 'error', []
+    finally:
+        if code_profiler is not None:
+            code_profiler.stop()
+            timer.record['pstats'] = code_profiler.save('multiqc_profile_module_{}.pstats'.format(this_module))
+        timer.stop()
+
+def run_module_worker(idx):
+    """
+    Run a module in a worker process and return everything that it
+    added to the report. Workers are reused, so the report is first reset
+    to how it was before any modules were run.
+    """
+    profiling.forget_code_profilers()
+    state = report.get_state()
+    report.init()
+    for k in ('searchfiles', 'files', 'search_index', 'search_cache', 'multiqc_command'):
+        setattr(report, k, state[k])
+    report.html_ids = list(pool_html_ids)
+
+    status, output = run_module(pool_modules[idx])
+
+    # General statistics 'modify' functions can't be pickled. They are also
+    # called with 1 when saving the data as JSON, to show the multiplier.
+    for data, headers in zip(report.general_stats_data, report.general_stats_headers):
+        for k, h in headers.items():
+            if callable(h.get('modify')):
+                h['modify'] = PrecomputedModify(h['modify'], [d[k] for d in data.values() if k in d] + [1])
+
+    result = {
+        'status': status,
+        'output': [ModuleOutput(m) for m in output],
+        'general_stats_data': plain(report.general_stats_data),
+        'general_stats_headers': plain(report.general_stats_headers),
+        'data_sources': plain(report.data_sources),
+        'plot_data': plain(report.plot_data),
+        'saved_raw_data': plain(report.saved_raw_data),
+        'html_ids': report.html_ids[len(pool_html_ids):],
+        'lint_errors': report.lint_errors,
+        'num_hc_plots': report.num_hc_plots,
+        'num_mpl_plots': report.num_mpl_plots,
+        'bamqc_general_stats_html': report.bamqc_general_stats_html,
+        'runtime_profile': report.runtime_profile
+    }
+    try:
+        pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        logger.debug("Couldn't send results for '{}' back from worker, will run again: {}".format(list(pool_modules[idx].keys())[0], e))
+        return {'status': 'rerun'}
+    return result
+
+def merge_module_result(result):
+    """
+    Add everything that a module added to the report in a worker process
+    to the report in this process. Returns False without changing anything
+    if the HTML IDs used by the module clash with those already in the report.
+    """
+    if len(set(result['html_ids']) & set(report.html_ids)) > 0:
+        return False
+    report.html_ids.extend(result['html_ids'])
+    report.general_stats_data.extend(result['general_stats_data'])
+    report.general_stats_headers.extend(result['general_stats_headers'])
+    for mod, sections in result['data_sources'].items():
+        for section, sources in sections.items():
+            report.data_sources[mod][section].update(sources)
+    report.plot_data.update(result['plot_data'])
+    report.saved_raw_data.update(result['saved_raw_data'])
+    report.lint_errors.extend(result['lint_errors'])
+    report.num_hc_plots += result['num_hc_plots']
+    report.num_mpl_plots += result['num_mpl_plots']
+    if result['bamqc_general_stats_html'] != '':
+        report.bamqc_general_stats_html = result['bamqc_general_stats_html']
+    report.runtime_profile.extend(result['runtime_profile'])
+    return True
+
+def fork_context():
+    """
+    Returns a multiprocessing context that forks new processes, or None
+    if that isn't possible on this platform or from this process.
+    """
+    if multiprocessing.current_process().daemon:
+        return None # Worker processes can't start processes of their own
+    try:
+        return multiprocessing.get_context('fork')
+    except AttributeError:
+        return multiprocessing # Python 2 always forks on unix
+    except ValueError:
+        return None
+
+def run_modules(run_modules_list):
+    """
+    Generator which runs each module and yields (mod_dict, status, output)
+    in the order given. Uses a pool of worker processes if config.module_workers
+    is more than one, otherwise runs the modules one after another here.
+    Modules whose results can't be sent back from a worker, or whose HTML IDs
+    clash with an earlier module, are run again in this process.
+    """
+    global pool_modules, pool_html_ids
+    num_workers = config.module_workers
+    ctx = None
+    if num_workers is not None and num_workers > 1 and len(run_modules_list) > 1:
+        ctx = fork_context()
+        if ctx is None:
+            logger.warning("Can't run modules in parallel on this platform, running them one at a time")
+
+    if ctx is None:
+        for mod_dict in run_modules_list:
+            status, output = run_module(mod_dict)
+            yield mod_dict, status, output
+        return
+
+    logger.info("Running {} modules using {} processes".format(len(run_modules_list), num_workers))
+    # Import all of the modules (and the plotting libraries that they use) once,
+    # here, instead of again in every worker process
+    for mod_dict in run_modules_list:
+        try:
+            config.avail_modules[list(mod_dict.keys())[0]].load()
+        except Exception:
+            pass # Reported when the module is run
+    pool_modules = run_modules_list
+    pool_html_ids = list(report.html_ids)
+    pool = ctx.Pool(num_workers, report.init_archive_worker)
+    try:
+        results = pool.imap(run_module_worker, range(len(run_modules_list)))
+        for mod_dict, result in zip(run_modules_list, results):
+            if result['status'] == 'rerun' or not merge_module_result(result):
+                logger.debug("Running module '{}' again in the main process".format(list(mod_dict.keys())[0]))
+                status, output = run_module(mod_dict)
+                yield mod_dict, status, output
+            else:
+                yield mod_dict, result['status'], result['output']
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        pool_modules = list()
+        pool_html_ids = list()
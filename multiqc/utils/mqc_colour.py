@@ -4,8 +4,6 @@ Helper functions to manipulate colours and colour scales
 """
 
 from __future__ import print_function
-import spectra
-import numpy as np
 import re
 
 # Default logger will be replaced by caller
@@ -20,6 +18,8 @@ class mqc_colour_scale(object):
 		""" Initialise class with a colour scale """
 
 		self.colours = self.get_colours(name)
+		self.scale_domain = None
+		self.scale_rgb = None
 
 		# Sanity checks
 		minval = re.sub("[^0-9\.]", "", str(minval))
@@ -40,6 +40,47 @@ class mqc_colour_scale(object):
 
 	def get_colour(self, val, colformat='hex'):
 		""" Given a value, return a colour within the colour scale """
+		return self.get_colour_list([val], colformat)[0]
+
+
+	def get_colour_list(self, vals, colformat='hex'):
+		"""
+		Given a list of values, return a list with a colour within the colour
+		scale for each. The same as calling get_colour() for each value, but
+		the scale is only set up once and all of the colours are worked out
+		together, so is much faster for whole table columns.
+		"""
+		# Slow to import, so only when a table needs colours
+		import numpy as np
+		try:
+			nums = np.array([self.clean_value(val) for val in vals], dtype=float)
+			if self.scale_rgb is None:
+				# The colours at evenly spaced values across the scale
+				self.scale_domain = np.linspace(self.minval, self.maxval, len(self.colours))
+				self.scale_rgb = np.array([self.hex_to_rgb(c) for c in self.colours])
+
+			# Blend the colours either side of each value, in the same way as the old spectra scales
+			domain = self.scale_domain
+			seg = np.clip(np.searchsorted(domain, nums, side='left') - 1, 0, len(domain) - 2)
+			ratio = (nums - domain[seg]) / (domain[seg + 1] - domain[seg])
+			keep = 1.0 - ratio
+			rgb = (self.scale_rgb[seg] * keep[:, None]) + (self.scale_rgb[seg + 1] * ratio[:, None])
+
+			# Weird, I know. I ported this from the original JavaScript for continuity
+			# Seems to work better than adjusting brightness / saturation / luminosity
+			rgb = np.maximum(0, np.minimum(1, 1 + ((rgb - 1) * 0.3)))
+			rgb = np.floor(0.5 + np.nan_to_num(rgb) * 255).astype(int)
+
+			return ['' if np.isnan(n) else '#%02x%02x%02x' % (r, g, b) for n, (r, g, b) in zip(nums, rgb.tolist())]
+
+		except (ValueError, TypeError) as e:
+			# Shouldn't crash all of MultiQC just for colours
+			logger.debug("Couldn't get colours for scale from {} to {}: {}".format(self.minval, self.maxval, e))
+			return ['' for val in vals]
+
+
+	def clean_value(self, val):
+		""" Parse a value for get_colour_list(), limited to the scale. Returns NaN if it can't be parsed. """
 		try:
 			# Sanity checks
 			val = re.sub("[^0-9\.]", "", str(val))
@@ -48,20 +89,16 @@ class mqc_colour_scale(object):
 			val = float(val)
 			val = max(val, self.minval)
 			val = min(val, self.maxval)
+			return val
+		except:
+			return float('nan')
 
-			domain_nums = list( np.linspace(self.minval, self.maxval, len(self.colours)) )
-			my_scale = spectra.scale(self.colours).domain(domain_nums)
-
-			# Weird, I know. I ported this from the original JavaScript for continuity
-			# Seems to work better than adjusting brightness / saturation / luminosity
-			rgb_converter = lambda x: max(0, min(1, 1+((x-1)*0.3)))
-			thecolour = spectra.rgb( *[rgb_converter(v) for v in my_scale(val).rgb] )
-
-			return thecolour.hexcode
 
-		except:
-			# Shouldn't crash all of MultiQC just for colours
-			return ''
+	@staticmethod
+	def hex_to_rgb(colour):
+		""" Convert a #RRGGBB colour to a tuple of red, green and blue from 0 to 1 """
+		colour = colour.lstrip('#')
+		return tuple(int(colour[i:i+2], 16) / 255.0 for i in (0, 2, 4))
 
 
 	def get_colours(self, name='GnBu'):
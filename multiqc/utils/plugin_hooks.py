@@ -4,18 +4,79 @@
 to run their own custom subroutines at predefined
 trigger points during MultiQC execution. """
 
-import pkg_resources
+from collections import OrderedDict
+import inspect
 
-# Load the hooks
-hook_functions = {}
-for entry_point in pkg_resources.iter_entry_points('multiqc.hooks.v1'):
-  nicename = str(entry_point).split('=')[0].strip()
+from multiqc.utils import config, report, profiling
+
+# The hooks, loaded when the first one is triggered
+hook_functions = None
+
+class HookContext(object):
+  """
+  Passed to hook functions that take an argument, with how long the
+  run has taken so far. All times are wall times in seconds.
+    trigger: the name of the hook trigger
+    elapsed: time since the run started
+    phases: time taken by each finished phase of the run, in order
+    modules: time taken by each module that has finished
+    intervals: time taken by each finished interval between triggers,
+               such as 'modules' (before_modules to after_modules)
+    pstats_files: cProfile stats saved in the data directory so far, with --profile
+    records: all of the runtime profile records so far
+  """
+
+  def __init__(self, trigger):
+    self.trigger = trigger
+    self.elapsed = profiling.elapsed()
+    self.records = list(report.runtime_profile)
+    self.phases = OrderedDict()
+    self.modules = OrderedDict()
+    self.intervals = OrderedDict()
+    times = {'phase': self.phases, 'module': self.modules, 'interval': self.intervals}
+    for r in self.records:
+      if r['type'] in times:
+        times[r['type']][r['name']] = r['wall_time']
+    self.pstats_files = [r['pstats'] for r in self.records if r.get('pstats') is not None]
+
+def load_hooks():
+  global hook_functions
+  hook_functions = {}
+  for entry_point in config.iter_entry_points('multiqc.hooks.v1'):
+    nicename = entry_point.name
+    try:
+      hook_functions[nicename].append(entry_point.load())
+    except KeyError:
+      hook_functions[nicename] = [entry_point.load()]
+
+def takes_context(hook):
+  """ Hooks written before the context was added take no arguments """
   try:
-    hook_functions[nicename].append(entry_point.load())
-  except KeyError:
-    hook_functions[nicename] = [entry_point.load()]
+    inspect.signature(hook).bind(None)
+  except AttributeError:
+    # Python 2
+    try:
+      spec = inspect.getargspec(hook)
+    except TypeError:
+      return False
+    num_args = len(spec.args) - (1 if inspect.ismethod(hook) else 0)
+    return num_args > 0 or spec.varargs is not None
+  except (TypeError, ValueError):
+    return False
+  return True
 
 # Function to run the hooks
 def mqc_trigger (trigger):
-  for hook in hook_functions.get(trigger, []):
-    hook()
+  profiling.trigger(trigger)
+  if hook_functions is None:
+    load_hooks()
+  hooks = hook_functions.get(trigger, [])
+  if len(hooks) == 0:
+    return
+  context = HookContext(trigger)
+  with profiling.Timer('hook', trigger):
+    for hook in hooks:
+      if takes_context(hook):
+        hook(context)
+      else:
+        hook()
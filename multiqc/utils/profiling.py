@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+""" MultiQC runtime profiling. Records the wall time, CPU time and peak memory
+use of each phase of a run, each module and each plot (noting the report
+section that it was made for), so that we can see where a run spends its time. The records are saved to
+multiqc_profile.json in the data directory, and can be summarised in the log.
+The intervals between some plugin hook triggers are timed too, and with
+config.profile_code these and each module are profiled with cProfile. """
+
+from __future__ import print_function
+from collections import OrderedDict
+import contextlib
+import functools
+import inspect
+import io
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None # Windows
+
+from multiqc.utils import config, report
+logger = config.logger
+
+# Timers that are running, innermost last
+stack = list()
+# The timer for the current phase of the run, started by phase()
+current_phase = None
+# When the run started, and the CPU time used by then, from start()
+run_start = None
+run_cpu_start = None
+# cProfile profilers that are running, innermost last. Only the last is enabled.
+code_stack = list()
+
+# The plugin hook triggers that start and end each interval of the run
+intervals = OrderedDict([
+    ('modules', ('before_modules', 'after_modules')),
+    ('template', ('before_template', 'execution_finish'))
+])
+# The Timer and CodeProfiler (if any) for each interval that has started
+running_intervals = dict()
+
+def cpu_time():
+    """ CPU time used by this process so far, in seconds """
+    try:
+        return time.process_time()
+    except AttributeError:
+        return time.clock() # Python 2, which gives CPU time on unix
+
+def peak_rss():
+    """ Peak resident memory of this process so far, in MB, or None if unknown """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives kilobytes and macOS gives bytes
+    if sys.platform == 'darwin':
+        return rss / (1024.0 * 1024.0)
+    return rss / 1024.0
+
+class Timer(object):
+    """
+    Records how long something takes. Use in a with block:
+
+        with profiling.Timer('plot', 'bargraph') as t:
+            ...
+        t.record['wall_time']
+
+    The record is added to report.runtime_profile when the timer stops, noting
+    the module that it ran in, if any.
+    """
+
+    def __init__(self, kind, name, **extra):
+        self.record = {'type': kind, 'name': name}
+        self.record.update(extra)
+        self.wall_start = None
+        self.cpu_start = None
+
+    def start(self):
+        for t in reversed(stack):
+            if t.record['type'] == 'module':
+                self.record['module'] = t.record['name']
+                break
+        stack.append(self)
+        self.wall_start = time.time()
+        self.cpu_start = cpu_time()
+        return self
+
+    def stop(self):
+        self.record['wall_time'] = time.time() - self.wall_start
+        self.record['cpu_time'] = cpu_time() - self.cpu_start
+        self.record['peak_rss_mb'] = peak_rss()
+        if self in stack:
+            del stack[stack.index(self):]
+        report.runtime_profile.append(self.record)
+        return self.record
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+class CodeProfiler(object):
+    """
+    Profiles the Python code run between start() and stop() with cProfile.
+    Only one profiler can be enabled at once, so an outer profiler is paused
+    while an inner one runs, and the inner one's stats are added to its own.
+    """
+
+    def __init__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+        self.children = list()
+
+    def start(self):
+        if len(code_stack) > 0:
+            code_stack[-1].profile.disable()
+        code_stack.append(self)
+        self.profile.enable()
+        return self
+
+    def stop(self):
+        self.profile.disable()
+        if self in code_stack:
+            code_stack.remove(self)
+            if len(code_stack) > 0:
+                code_stack[-1].children.append(self)
+                code_stack[-1].profile.enable()
+        return self
+
+    def stats(self):
+        """ pstats.Stats for this profiler and the profilers that ran inside it """
+        import pstats
+        stats = pstats.Stats(self.profile)
+        for child in self.children:
+            stats.add(child.stats())
+        return stats
+
+    def save(self, fn):
+        """
+        Save the stats to fn in the data directory, which can be read with pstats
+        or tools such as snakeviz. Returns fn, or None if there's no data directory.
+        """
+        if config.data_dir is None or not os.path.isdir(config.data_dir):
+            logger.warning("Can't save profile '{}' without a data directory".format(fn))
+            return None
+        try:
+            self.stats().dump_stats(os.path.join(config.data_dir, fn))
+        except (TypeError, IOError, OSError) as e:
+            logger.warning("Couldn't save profile '{}': {}".format(fn, e))
+            return None
+        return fn
+
+def forget_code_profilers():
+    """ Stop the cProfile profilers inherited by a forked worker process, without saving them """
+    for p in code_stack:
+        p.profile.disable()
+    del code_stack[:]
+
+def timed_plot(plot_type):
+    """
+    Decorator for the plot() function of each plot type, to record how long
+    each plot takes to build. The plot ID is taken from its pconfig, if given.
+    """
+    def decorator(plot_fn):
+        @functools.wraps(plot_fn)
+        def wrapper(*args, **kwargs):
+            with Timer('plot', plot_type) as t:
+                result = plot_fn(*args, **kwargs)
+                try:
+                    t.record['id'] = inspect.getcallargs(plot_fn, *args, **kwargs)['pconfig']['id']
+                except (KeyError, TypeError):
+                    pass
+            return result
+        return wrapper
+    return decorator
+
+def start():
+    """ Start profiling a new run, dropping anything left over from an earlier run """
+    global current_phase, run_start, run_cpu_start
+    del stack[:]
+    forget_code_profilers()
+    running_intervals.clear()
+    current_phase = None
+    run_start = time.time()
+    run_cpu_start = cpu_time()
+
+@contextlib.contextmanager
+def run_profile():
+    """
+    Profile a run in a with block. Stops any cProfile profilers that are
+    still running at the end, such as when the run ends early, so that
+    the rest of the process isn't profiled.
+    """
+    start()
+    try:
+        yield
+    finally:
+        forget_code_profilers()
+        running_intervals.clear()
+
+def trigger(name):
+    """
+    Start and end the intervals of the run that start or end at the plugin
+    hook trigger called name. Profiles each interval with cProfile if
+    config.profile_code is set, saving multiqc_profile_<interval>.pstats.
+    """
+    for interval, (start_trigger, end_trigger) in intervals.items():
+        if name == end_trigger and interval in running_intervals:
+            stop_interval(interval)
+        if name == start_trigger:
+            timer = Timer('interval', interval).start()
+            code_profiler = CodeProfiler().start() if config.profile_code else None
+            running_intervals[interval] = (timer, code_profiler)
+
+def stop_interval(interval):
+    """ End an interval that is running, saving its cProfile stats if it has any """
+    timer, code_profiler = running_intervals.pop(interval)
+    if code_profiler is not None:
+        code_profiler.stop()
+        timer.record['pstats'] = code_profiler.save('multiqc_profile_{}.pstats'.format(interval))
+    timer.stop()
+
+def elapsed():
+    """ Wall time since the run started, in seconds """
+    return time.time() - run_start
+
+def phase(name):
+    """ Finish the current phase of the run, if any, and start a new one called name """
+    global current_phase
+    if current_phase is not None:
+        current_phase.stop()
+        current_phase = None
+    if name is not None:
+        current_phase = Timer('phase', name).start()
+
+def finish():
+    """
+    Finish the current phase, and any intervals that haven't reached their end
+    trigger, and return the profile of the whole run. Their cProfile stats are
+    saved in the data directory, so this must be called before it is zipped.
+    """
+    phase(None)
+    for interval in list(running_intervals):
+        stop_interval(interval)
+    return {
+        'multiqc_version': config.version,
+        'wall_time': time.time() - run_start,
+        'cpu_time': cpu_time() - run_cpu_start,
+        'peak_rss_mb': peak_rss(),
+        'records': report.runtime_profile
+    }
+
+def write_profile(profile, data_dir):
+    """ Save a run's profile to multiqc_profile.json in the data directory """
+    fn = os.path.join(data_dir, 'multiqc_profile.json')
+    with io.open(fn, 'w', encoding='utf-8') as f:
+        jsonstr = json.dumps(profile, indent=4, ensure_ascii=False)
+        print(jsonstr.encode('utf-8', 'ignore').decode('utf-8'), file=f)
+
+def log_summary(profile, num_rows=10):
+    """ Log a table of the time taken by each phase, and the slowest modules and plots """
+    rows = [r for r in profile['records'] if r['type'] == 'phase']
+    for kind in ('module', 'plot'):
+        records = [r for r in profile['records'] if r['type'] == kind]
+        rows.extend(sorted(records, key=lambda r: r['wall_time'], reverse=True)[:num_rows])
+    lines = ["{:<8} {:<50} {:>9} {:>9} {:>9}".format('Type', 'Name', 'Wall (s)', 'CPU (s)', 'RSS (MB)')]
+    for r in rows:
+        name = r['name']
+        if r.get('id') is not None:
+            name = '{} ({})'.format(r['id'], name)
+        if r.get('module') is not None and r['type'] != 'module':
+            name = '{}: {}'.format(r['module'], name)
+        rss = '-' if r['peak_rss_mb'] is None else '{:.0f}'.format(r['peak_rss_mb'])
+        lines.append("{:<8} {:<50} {:>9.2f} {:>9.2f} {:>9}".format(r['type'], name[:50], r['wall_time'], r['cpu_time'], rss))
+    rss = '-' if profile['peak_rss_mb'] is None else '{:.0f}'.format(profile['peak_rss_mb'])
+    lines.append("{:<8} {:<50} {:>9.2f} {:>9.2f} {:>9}".format('total', '', profile['wall_time'], profile['cpu_time'], rss))
+    logger.info("Runtime profile:\n" + "\n".join(lines))
@@ -6,18 +6,48 @@ helper functions to generate markup for report. """
 
 from __future__ import print_function
 from collections import defaultdict, OrderedDict
+import base64
+import bz2
 import click
 import fnmatch
+import functools
+import gzip
+import hashlib
 import io
+import itertools
 import json
 import inspect
 import lzstring
 import mimetypes
+import multiprocessing
+import multiprocessing.pool
+import multiprocessing.util
 import os
 import re
+import sqlite3
+import stat
+import sys
+import tarfile
+import time
 import yaml
+import zipfile
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    lzma = None # Python 2
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir # Python 2 backport
+    except ImportError:
+        scandir = None
 
 from multiqc import config
+from multiqc.utils import columnar
 logger = config.logger
 
 # Treat defaultdict and OrderedDict as normal dicts for YAML output
@@ -29,28 +59,154 @@ try:
 except NameError:
     pass # Python 3
 
-# Set up global variables shared across modules
-general_stats_data = list()
-general_stats_headers = list()
-general_stats_html = ''
-bamqc_general_stats_html = ''
-data_sources = defaultdict(lambda:defaultdict(lambda:defaultdict()))
-plot_data = dict()
-html_ids = list()
-lint_errors = list()
-num_hc_plots = 0
-num_mpl_plots = 0
-saved_raw_data = dict()
-last_found_file = None
-
-# Make a dict of discovered files for each seach key
-searchfiles = list()
-files = dict()
+# Global variables shared across modules, holding the state of the current report.
+# Reset by init() and swapped in and out by Report objects.
+state_vars = (
+    'general_stats_data', 'general_stats_headers', 'general_stats_html', 'bamqc_general_stats_html',
+    'data_sources', 'plot_data', 'plot_compressed_json', 'plot_compressed_chunks', 'plot_data_encoding', 'html_ids', 'lint_errors',
+    'num_hc_plots', 'num_mpl_plots', 'saved_raw_data', 'last_found_file',
+    'modules_output', 'multiqc_command', 'searchfiles', 'files', 'search_index', 'search_cache',
+    'runtime_profile'
+)
+# Declared here so that they can be found, but only given their values by init()
+general_stats_data = general_stats_headers = general_stats_html = bamqc_general_stats_html = None
+data_sources = plot_data = plot_compressed_json = plot_compressed_chunks = plot_data_encoding = None
+html_ids = lint_errors = num_hc_plots = num_mpl_plots = saved_raw_data = last_found_file = None
+modules_output = multiqc_command = searchfiles = files = search_index = search_cache = None
+runtime_profile = None
+
+def blank_state():
+    """ Returns a dict with the starting value of each of the report's global variables """
+    return {
+        'general_stats_data': list(),
+        'general_stats_headers': list(),
+        'general_stats_html': '',
+        'bamqc_general_stats_html': '',
+        'data_sources': defaultdict(lambda:defaultdict(lambda:defaultdict())),
+        'plot_data': dict(),
+        'plot_compressed_json': '',
+        'plot_compressed_chunks': OrderedDict(),
+        'plot_data_encoding': 'lzstring',
+        'html_ids': list(),
+        'lint_errors': list(),
+        'num_hc_plots': 0,
+        'num_mpl_plots': 0,
+        'saved_raw_data': dict(),
+        'last_found_file': None,
+        'modules_output': list(),
+        'multiqc_command': '',
+        # Discovered files for each search key
+        'searchfiles': list(),
+        'files': dict(),
+        'search_index': None,
+        'search_cache': None,
+        # Timings recorded by profiling.Timer
+        'runtime_profile': list()
+    }
+
+def get_state():
+    """ Returns a dict with the current value of each of the report's global variables """
+    g = globals()
+    return dict((k, g[k]) for k in state_vars)
+
+def set_state(state):
+    """ Sets the report's global variables from a dict made by get_state() """
+    globals().update((k, state[k]) for k in state_vars)
+
+def close_archives():
+    """ Close the archives opened by open_archive_member() """
+    for af in open_archives.values():
+        af.close()
+    open_archives.clear()
+
+def init():
+    """
+    Reset the report to a blank state, ready for a new run. Anything left over
+    from an earlier run in this process, including any archives still open, is dropped.
+    """
+    set_state(blank_state())
+    close_archives()
+
+class Report(object):
+    """
+    The state of a single report. Modules add their results to the global
+    variables in this module, so that they can all see each other's results.
+    A Report holds its own copy of these, which is swapped in while it is the
+    current report. Use it in a with block to run MultiQC more than once in
+    the same process without the runs leaking into each other:
+
+        with report.Report() as r:
+            # Find files and run modules as usual
+        r.general_stats_data # Still available afterwards
+
+    The report's variables can be read and set as attributes of the Report
+    at any time. Reports can be nested, but the outer report is put aside
+    until the inner one finishes. Only swaps the module globals in and out,
+    so modules and plot functions always write to whichever report is current:
+    reports must be made one after another, never at the same time from
+    different threads. Run them in separate processes to make them at once.
+    This is internal to MultiQC and isn't part of the multiqc.run() API.
+    """
+
+    def __init__(self, state=None):
+        object.__setattr__(self, 'state', state if state is not None else blank_state())
+        object.__setattr__(self, 'active', False)
+        object.__setattr__(self, 'previous', None)
+
+    def __enter__(self):
+        global current
+        current.deactivate()
+        object.__setattr__(self, 'previous', current)
+        set_state(self.state)
+        object.__setattr__(self, 'active', True)
+        current = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        global current
+        self.deactivate()
+        previous = self.previous
+        object.__setattr__(self, 'previous', None)
+        set_state(previous.state)
+        object.__setattr__(previous, 'active', True)
+        current = previous
+
+    def deactivate(self):
+        """ Copy the global variables back into this report when it stops being current """
+        if self.active:
+            object.__setattr__(self, 'state', get_state())
+            object.__setattr__(self, 'active', False)
+
+    def __getattr__(self, name):
+        if name in state_vars:
+            if self.active:
+                return globals()[name]
+            return self.state[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name not in state_vars:
+            raise AttributeError("'{}' is not a report variable".format(name))
+        if self.active:
+            globals()[name] = value
+        else:
+            self.state[name] = value
+
+# Archives opened by open_log_file(), kept open as modules read their members in turn
+open_archives = dict()
+
+# The report that the global variables currently belong to
+init()
+current = Report(get_state())
+object.__setattr__(current, 'active', True)
+
 def get_filelist(run_module_names):
     """
     Go through all supplied search directories and assembly a master
     list of files to search. Then fire search functions for each file.
     """
+    global search_index, search_cache
+
     # Prep search patterns
     spatterns = [{},{},{},{},{},{},{}]
     epatterns = [{}, {}]
@@ -103,196 +259,993 @@ def get_filelist(run_module_names):
     if len(ignored_patterns) > 0:
         logger.debug("Ignored search patterns as didn't match running modules: {}".format(', '.join(ignored_patterns)))
 
-    def add_file(fn, root):
-        """
-        Function applied to each file found when walking the analysis
-        directories. Runs through all search patterns and returns True
-        if a match is found.
-        """
-        f = {'fn': fn, 'root': root}
+    # Compile everything once, so that each file can be classified in a single pass
+    search_index = SearchPatternIndex(spatterns, config.fn_ignore_files)
 
-        # Check that this is a file and not a pipe or anything weird
-        if not os.path.isfile(os.path.join(root, fn)):
-            return None
-
-        # Check that we don't want to ignore this file
-        i_matches = [n for n in config.fn_ignore_files if fnmatch.fnmatch(fn, n)]
-        if len(i_matches) > 0:
-            logger.debug("Ignoring file as matched an ignore pattern: {}".format(fn))
-            return None
-
-        # Limit search to small files, to avoid 30GB FastQ files etc.
-        try:
-            f['filesize'] = os.path.getsize(os.path.join(root,fn))
-        except (IOError, OSError, ValueError, UnicodeDecodeError):
-            logger.debug("Couldn't read file when checking filesize: {}".format(fn))
-        else:
-            if f['filesize'] > config.log_filesize_limit:
-                return False
-
-        # Test file for each search pattern
-        for patterns in spatterns:
-            for key, sps in patterns.items():
-                for sp in sps:
-                    if search_file (sp, f):
-                        # Check that we shouldn't exclude this file
-                        if not exclude_file(sp, f):
-                            # Looks good! Remember this file
-                            files[key].append(f)
-                        # Don't keep searching this file for other modules
-                        if not sp.get('shared', False):
-                            return
-                        # Don't look at other patterns for this module
-                        else:
-                            break
+    # Load previous search results for files that haven't changed
+    search_cache = None
+    if config.filesearch_cache:
+        cache_dir = config.filesearch_cache_dir
+        if cache_dir is None:
+            cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser(os.path.join('~', '.cache'))), 'multiqc')
+        signature = [config.version, config.filesearch_magic, config.decompress_logs, config.filesearch_archives, sorted(run_module_names), [list(t.items()) for t in spatterns]]
+        signature = json.dumps(signature, sort_keys=True, default=str)
+        signature = hashlib.sha1(signature.encode('utf-8')).hexdigest()
+        search_cache = SearchCache(os.path.join(cache_dir, 'filesearch_cache.sqlite'), signature)
 
     # Go through the analysis directories and get file list
+    ignore_dirs = compile_globs([n.rstrip(os.sep) for n in config.fn_ignore_dirs])
+    ignore_paths = compile_globs([n.rstrip(os.sep) for n in config.fn_ignore_paths])
+    searched_dirs = list()
     for path in config.analysis_dir:
         if os.path.islink(path) and config.ignore_symlinks:
             continue
         elif os.path.isfile(path):
             searchfiles.append([os.path.basename(path), os.path.dirname(path)])
         elif os.path.isdir(path):
-            for root, dirnames, filenames in os.walk(path, followlinks=(not config.ignore_symlinks), topdown=True):
-                bname = os.path.basename(root)
-
-                # Skip any sub-directories matching ignore params
-                orig_dirnames = dirnames[:]
-                for n in config.fn_ignore_dirs:
-                    dirnames[:] = [d for d in dirnames if not fnmatch.fnmatch(d, n.rstrip(os.sep))]
-                    if len(orig_dirnames) != len(dirnames):
-                        removed_dirs = [os.path.join(root, d) for d in set(orig_dirnames).symmetric_difference(set(dirnames))]
-                        logger.debug("Ignoring directory as matched fn_ignore_dirs: {}".format(", ".join(removed_dirs)))
-                        orig_dirnames = dirnames[:]
-                for n in config.fn_ignore_paths:
-                    dirnames[:] = [d for d in dirnames if not fnmatch.fnmatch(os.path.join(root, d), n.rstrip(os.sep))]
-                    if len(orig_dirnames) != len(dirnames):
-                        removed_dirs = [os.path.join(root, d) for d in set(orig_dirnames).symmetric_difference(set(dirnames))]
-                        logger.debug("Ignoring directory as matched fn_ignore_paths: {}".format(", ".join(removed_dirs)))
-
-                # Skip *this* directory if matches ignore params
-                d_matches = [n for n in config.fn_ignore_dirs if fnmatch.fnmatch(bname, n.rstrip(os.sep))]
-                if len(d_matches) > 0:
-                    logger.debug("Ignoring directory as matched fn_ignore_dirs: {}".format(bname))
-                    continue
-                p_matches = [n for n in config.fn_ignore_paths if fnmatch.fnmatch(root, n.rstrip(os.sep))]
-                if len(p_matches) > 0:
-                    logger.debug("Ignoring directory as matched fn_ignore_paths: {}".format(root))
-                    continue
-                # Search filenames in this directory
-                for fn in filenames:
-                    searchfiles.append([fn, root])
+            # Skip *this* directory if matches ignore params
+            if ignore_dirs is not None and ignore_dirs.match(os.path.normcase(os.path.basename(path))):
+                logger.debug("Ignoring directory as matched fn_ignore_dirs: {}".format(os.path.basename(path)))
+                continue
+            if ignore_paths is not None and ignore_paths.match(os.path.normcase(path)):
+                logger.debug("Ignoring directory as matched fn_ignore_paths: {}".format(path))
+                continue
+            searchfiles.extend(walk_dir(path, ignore_dirs, ignore_paths))
+            searched_dirs.append(path)
+
+    # Files from --file-list are streamed straight into the search, however many there are.
+    # They're added to searchfiles as they go, for old style find_log_files() search patterns
+    if config.file_list:
+        sfiles = record_searchfiles(stat_filelist(read_filelist(config.file_list)))
+        label = "Searching files from {}..".format('stdin' if config.file_list == '-' else config.file_list)
+        length = None
+    else:
+        sfiles = searchfiles
+        label = "Searching {} files..".format(len(searchfiles))
+        length = len(searchfiles)
+
     # Search through collected files
-    with click.progressbar(searchfiles, label="Searching {} files..".format(len(searchfiles))) as sfiles:
+    archives = list()
+    num_searched = 0
+    results = search_filelist(sfiles)
+    with click.progressbar(results, length=length, label=label) as sresults:
+        for f, matched_keys, fingerprint in sresults:
+            num_searched += 1
+            # Results come back in the same order as searchfiles, whatever
+            # the number of workers, so the file lists are deterministic
+            for key in matched_keys:
+                files[key].append(f)
+            if search_cache is not None:
+                path_key = search_cache.path_key(f['root'], f['fn'])
+                search_cache.add_seen(path_key)
+                if fingerprint is not None:
+                    search_cache.add(path_key, fingerprint, matched_keys)
+            # Archives that weren't picked up by a module are searched like directories
+            if len(matched_keys) == 0 and is_archive(f['fn']):
+                archives.append([f['fn'], f['root']])
+    if search_cache is not None:
+        search_cache.save(searched_dirs)
+    if config.file_list and num_searched == 0:
+        logger.error("No files were added from {} using --file-list option.".format(config.file_list))
+        logger.error("Please, check that {} contains correct file paths.".format(config.file_list))
+        raise ValueError("Any files to be searched.")
+
+    # Search through the files inside archives
+    if len(archives) > 0:
+        results = search_filelist(archives, search_archive)
+        with click.progressbar(results, length=len(archives), label="Searching {} archives..".format(len(archives))) as sresults:
+            for aresults in sresults:
+                for f, matched_keys in aresults:
+                    for key in matched_keys:
+                        files[key].append(f)
+
+def modules_without_files(run_module_names):
+    """
+    Find the modules whose search patterns all matched nothing in get_filelist(),
+    so that they don't need to be imported or run. Modules without any search
+    patterns may find their data some other way, so are never included, and
+    nor is Custom Content.
+    :param run_module_names: Names of the modules being run
+    :return: Set of module names that didn't find any files
+    """
+    num_files = dict()
+    for key, key_files in files.items():
+        mod_name = key.split('/', 1)[0].lower()
+        num_files[mod_name] = num_files.get(mod_name, 0) + len(key_files)
+    return set(m for m in run_module_names if m != 'custom_content' and num_files.get(m.lower()) == 0)
+
+# Lookup tables of file extensions for compressed files and images, built from mimetypes on first use
+binary_extensions = None
+image_extensions = None
+def is_binary_filename(fn):
+    """
+    Check whether a filename has an extension that mimetypes would guess as
+    a compressed file or an image. Gives the same result as calling
+    mimetypes.guess_type() but with a couple of dict lookups.
+    """
+    global binary_extensions, image_extensions
+    if binary_extensions is None:
+        mimetypes.init()
+        image_extensions = set([ext for ext, ftype in mimetypes.types_map.items() if ftype.startswith('image')])
+        binary_extensions = set(mimetypes.encodings_map.keys()) | set(mimetypes.suffix_map.keys())
+    ext = os.path.splitext(fn)[1]
+    return ext in binary_extensions or ext in image_extensions or ext.lower() in image_extensions
+
+# Magic bytes at the start of binary files that can't be log files.
+# BGZF (BAM, BCF, tabix) is a type of gzip so is caught by the first one.
+# Signatures that are printable text are given in full (with the version
+# or block size that follows), so that text logs starting with the same
+# letters aren't mistaken for them.
+binary_magic = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'PK\x03\x04', 'zip'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'%PDF-', 'pdf'),
+    (b'BAM\x01', 'bam'),
+    (b'CRAM\x02', 'cram'),
+    (b'CRAM\x03', 'cram')
+] + [(b'BZh' + str(n).encode('ascii'), 'bzip2') for n in range(1, 10)]
+def sniff_magic(head):
+    """ Returns the type of binary file from the first few bytes, or None if not recognised """
+    for magic, ftype in binary_magic:
+        if head.startswith(magic):
+            return ftype
+    return None
+
+def compile_globs(patterns):
+    """ Compile a list of glob patterns into a single regex, or None if the list is empty """
+    if len(patterns) == 0:
+        return None
+    return re.compile('|'.join([fnmatch.translate(os.path.normcase(p)) for p in patterns]))
+
+# Compressed file extensions that are read transparently with config.decompress_logs
+compression_extensions = {
+    '.gz': 'gzip',
+    '.bz2': 'bzip2',
+    '.xz': 'xz'
+}
+# Exceptions that can come from reading a broken or unreadable (compressed) file
+read_errors = (IOError, OSError, ValueError, UnicodeDecodeError, EOFError, zlib.error)
+if lzma is not None:
+    read_errors += (lzma.LZMAError,)
+
+def get_compression(fn):
+    """
+    Returns the compression type of a file that should be decompressed on
+    the fly, from its file extension, or None if it should be read as is.
+    """
+    if not config.decompress_logs:
+        return None
+    return compression_extensions.get(os.path.splitext(fn)[1])
+
+def strip_compression(fn):
+    """ Returns a filename without its compression extension, used for matching search patterns """
+    if get_compression(fn) is None:
+        return fn
+    return os.path.splitext(fn)[0]
+
+def open_binary(path, compression=None):
+    """
+    Open a file for reading as bytes. Compressed files are decompressed
+    incrementally as they are read, so only the part needed is ever inflated.
+    """
+    if compression == 'gzip':
+        return gzip.GzipFile(path, 'rb')
+    if compression == 'bzip2':
+        return bz2.BZ2File(path, 'rb')
+    if compression == 'xz':
+        if lzma is None:
+            raise IOError("Reading xz compressed files needs Python 3: {}".format(path))
+        return lzma.LZMAFile(path, 'rb')
+    return io.open(path, 'rb')
+
+def decompress_stream(fh, compression=None):
+    """ Wrap an open binary file handle so that it is decompressed as it is read """
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fh, mode='rb')
+    if compression == 'bzip2':
+        if sys.version_info[0] < 3:
+            raise IOError("Reading bzip2 compressed files inside archives needs Python 3")
+        return bz2.BZ2File(fh)
+    if compression == 'xz':
+        if lzma is None:
+            raise IOError("Reading xz compressed files needs Python 3")
+        return lzma.LZMAFile(fh)
+    return fh
+
+class ReadIntoAdapter(io.RawIOBase):
+    """
+    Python 2 file objects such as bz2.BZ2File, GzipFile and tar members don't
+    have all of the methods that io.TextIOWrapper needs. This reads from them
+    with read(), so that they can be put in an io.BufferedReader instead.
+    """
+
+    def __init__(self, fh):
+        self.fh = fh
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.fh.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.fh.close()
+        io.RawIOBase.close(self)
+
+def text_reader(fh):
+    """ Wrap an open binary file handle to read it as UTF-8 text """
+    if sys.version_info[0] < 3 and not isinstance(fh, io.BufferedReader):
+        fh = io.BufferedReader(ReadIntoAdapter(fh))
+    return io.TextIOWrapper(fh, encoding='utf-8')
+
+def open_log_file(f, binary=False):
+    """
+    Open a discovered file dict for reading as text, decompressing
+    it on the fly if it is compressed and config.decompress_logs is set.
+    Files found inside archives are read straight out of the archive.
+    Returns a binary file handle instead if binary is True.
+    """
+    compression = get_compression(f['fn'])
+    if 'archive' in f:
+        fh = decompress_stream(open_archive_member(f['archive'], f['member']), compression)
+    elif compression is None and not binary:
+        return io.open(os.path.join(f['root'], f['fn']), 'r', encoding='utf-8')
+    else:
+        fh = open_binary(os.path.join(f['root'], f['fn']), compression)
+    if binary:
+        return fh
+    return text_reader(fh)
+
+def iter_lines(fh, fn):
+    """
+    Generator yielding each line of an open text file without its line ending,
+    reading the file a buffer at a time so that it is never held in memory all
+    at once. Lines are split on universal newlines (\\n, \\r\\n and \\r) only, unlike
+    splitlines(), which also splits on characters such as \\x0b, \\x0c, \\x1c-\\x1e,
+    \\x85, \\u2028 and \\u2029. Logs a warning and stops if the rest of the file
+    can't be read, as the contents would not have been returned.
+    """
+    try:
+        for line in fh:
+            yield line.rstrip('\r\n')
+    except read_errors as e:
+        logger.warning("Couldn't read all of '{}': {}".format(fn, e))
+
+# Archive file extensions that are searched like directories with config.filesearch_archives
+archive_extensions = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.zip')
+def is_archive(fn):
+    """ Check whether a file is an archive that should be searched like a directory """
+    return config.filesearch_archives and fn.lower().endswith(archive_extensions)
+
+def iter_archive_members(path):
+    """
+    Generator yielding (member name, size, opener) for each regular file in a
+    tar or zip archive, in archive order. Tar archives are read front to back,
+    so each member should be read before the next one is yielded to avoid
+    compressed tarballs being decompressed from the start again.
+    """
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.filename.endswith('/'):
+                    yield info.filename, info.file_size, functools.partial(zf.open, info)
+    else:
+        with tarfile.open(path, 'r:*') as tf:
+            for member in tf:
+                if member.isfile():
+                    yield member.name, member.size, functools.partial(tf.extractfile, member)
+
+def init_archive_worker():
+    """
+    Initialiser for worker processes that may read files inside archives. Forked
+    workers inherit the archives already open in the parent, whose file offset
+    is shared with the parent and every other worker, so reading members from
+    them at the same time can give corrupted contents. The worker forgets them
+    and opens its own, which are closed when the worker exits.
+    """
+    open_archives.clear()
+    multiprocessing.util.Finalize(None, close_archives, exitpriority=0)
+
+def open_archive_member(archive, member):
+    """ Open a file inside a tar or zip archive for reading as bytes """
+    if archive not in open_archives:
+        if archive.lower().endswith('.zip'):
+            open_archives[archive] = zipfile.ZipFile(archive)
+        else:
+            open_archives[archive] = tarfile.open(archive, 'r:*')
+    af = open_archives[archive]
+    if isinstance(af, zipfile.ZipFile):
+        return af.open(member)
+    return af.extractfile(member)
+
+def walk_dir(path, ignore_dirs=None, ignore_paths=None):
+    """
+    Generator yielding [fn, root] for every file under a directory, similar
+    to os.walk(). Uses scandir so that file types come from the directory
+    listing without extra system calls, and prunes sub-directories matching
+    the fn_ignore_dirs / fn_ignore_paths regexes before descending into them.
+    Symlinked directories are only followed if config.ignore_symlinks is False.
+    """
+    followlinks = not config.ignore_symlinks
+    stack = [path]
+    while len(stack) > 0:
+        root = stack.pop()
+        dirnames = list()
+        try:
+            if scandir is not None:
+                entries = list()
+                for entry in scandir(root):
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    # Pipes, sockets and so on can't be log files
+                    if not is_dir and not entry.is_symlink() and not entry.is_file(follow_symlinks=False):
+                        continue
+                    entries.append((entry.name, is_dir, is_dir and entry.is_symlink()))
+            else:
+                entries = list()
+                for name in os.listdir(root):
+                    fpath = os.path.join(root, name)
+                    is_dir = os.path.isdir(fpath)
+                    entries.append((name, is_dir, is_dir and os.path.islink(fpath)))
+        except OSError as e:
+            logger.debug("Couldn't list directory contents: {}".format(e))
+            continue
+        for name, is_dir, is_link in entries:
+            if not is_dir:
+                yield [name, root]
+                continue
+            if is_link and not followlinks:
+                continue
+            dpath = os.path.join(root, name)
+            # Skip any sub-directories matching ignore params
+            if ignore_dirs is not None and ignore_dirs.match(os.path.normcase(name)):
+                logger.debug("Ignoring directory as matched fn_ignore_dirs: {}".format(dpath))
+                continue
+            if ignore_paths is not None and ignore_paths.match(os.path.normcase(dpath)):
+                logger.debug("Ignoring directory as matched fn_ignore_paths: {}".format(dpath))
+                continue
+            dirnames.append(dpath)
+        # Walk sub-directories depth-first, in listing order
+        stack.extend(reversed(dirnames))
+
+# Number of paths from --file-list that are checked at a time, and the threads used to do it
+filelist_batch_size = 1000
+filelist_stat_threads = 8
+def read_filelist(fn):
+    """ Generator yielding each path in a --file-list file, or stdin if fn is '-' """
+    if fn == '-':
+        fh = sys.stdin
+    else:
+        fh = io.open(fn, 'r', encoding='utf-8')
+    try:
+        for line in fh:
+            path = line.strip()
+            if path:
+                yield path
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+
+def stat_searchfile(path):
+    """ Returns [fn, root, stat] for a listed path that is a regular file, otherwise None """
+    try:
+        fstat = os.stat(path)
+    except (IOError, OSError, ValueError, UnicodeDecodeError):
+        return None
+    if not stat.S_ISREG(fstat.st_mode):
+        return None
+    path = os.path.abspath(path)
+    return [os.path.basename(path), os.path.dirname(path), fstat]
+
+def stat_filelist(paths):
+    """
+    Generator which checks that each listed path exists, in batches on a pool of
+    threads so that slow filesystems don't hold things up, and yields [fn, root, stat]
+    for each one that is a regular file. Paths are yielded in input order and only
+    one batch is held in memory at a time.
+    """
+    pool = multiprocessing.pool.ThreadPool(filelist_stat_threads)
+    try:
+        batch = list()
+        for path in paths:
+            batch.append(path)
+            if len(batch) >= filelist_batch_size:
+                for sf in pool.map(stat_searchfile, batch):
+                    if sf is not None:
+                        yield sf
+                batch = list()
+        for sf in pool.map(stat_searchfile, batch):
+            if sf is not None:
+                yield sf
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def record_searchfiles(sfiles):
+    """ Generator which adds each [fn, root, stat] to searchfiles as it passes through """
+    for sf in sfiles:
+        searchfiles.append(sf)
+        yield sf
+
+def search_filelist(sfiles, search_func=None):
+    """
+    Generator which runs search_searchfile() (or search_archive()) on each
+    [fn, root] pair. Uses a pool of threads or processes if config.filesearch_workers
+    is more than one. Results are always yielded in input order.
+    sfiles can be a list or any other iterable, such as a stream of files from stat_filelist().
+    """
+    if search_func is None:
+        search_func = search_searchfile
+    num_workers = config.filesearch_workers
+    if num_workers is None or num_workers < 2 or (hasattr(sfiles, '__len__') and len(sfiles) < 2):
         for sf in sfiles:
-            add_file(sf[0], sf[1])
+            yield search_func(sf)
+        return
+
+    # Hand out files in chunks to keep the inter-worker chatter down
+    if hasattr(sfiles, '__len__'):
+        chunksize = max(1, min(1000, len(sfiles) // (num_workers * 4)))
+    else:
+        chunksize = 100
+    if config.filesearch_pool == 'process':
+        logger.debug("Searching files using {} processes".format(num_workers))
+        worker_config = {
+            'fn_ignore_files': config.fn_ignore_files,
+            'log_filesize_limit': config.log_filesize_limit,
+            'report_readerrors': config.report_readerrors,
+            'filesearch_magic': config.filesearch_magic,
+            'decompress_logs': config.decompress_logs,
+            'filesearch_archives': config.filesearch_archives,
+            'fn_ignore_dirs': config.fn_ignore_dirs,
+            'fn_ignore_paths': config.fn_ignore_paths
+        }
+        pool = multiprocessing.Pool(num_workers, init_search_worker, (search_index, search_cache, worker_config))
+    else:
+        if config.filesearch_pool != 'thread':
+            logger.warning("Unrecognised filesearch_pool '{}', using threads".format(config.filesearch_pool))
+        logger.debug("Searching files using {} threads".format(num_workers))
+        pool = multiprocessing.pool.ThreadPool(num_workers)
+    try:
+        if hasattr(sfiles, '__len__'):
+            windows = [sfiles]
+        else:
+            # Take a window of files at a time from a stream, so that it's never all held in memory
+            sfiles = iter(sfiles)
+            windows = iter(lambda: list(itertools.islice(sfiles, chunksize * num_workers * 10)), [])
+        for window in windows:
+            for result in pool.imap(search_func, window, chunksize):
+                yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
 
-def search_file (pattern, f):
+def init_search_worker(worker_search_index, worker_search_cache, worker_config):
     """
-    Function to searach a single file for a single search pattern.
+    Initialiser for file search worker processes. Makes sure that the
+    search patterns and config are the same as in the parent, even when
+    processes are spawned instead of forked.
     """
+    global search_index, search_cache
+    search_index = worker_search_index
+    search_cache = worker_search_cache
+    config.update(worker_config)
+    init_archive_worker()
 
-    fn_matched = False
-    contents_matched = False
+def search_searchfile(sf):
+    """
+    Function applied to each file found when walking the analysis
+    directories. Runs through all search patterns and returns the
+    file dict along with a list of the search pattern keys it matched.
+    Also returns a (mtime, size, inode) fingerprint if the result
+    should be saved to the search cache. sf can have a third item with
+    the result of os.stat() for the file, if this is already known.
+    Does not touch any global state, so can be run in a worker.
+    """
+    fn, root = sf[0], sf[1]
+    f = {'fn': fn, 'root': root}
+    matched_keys = list()
 
-    # Use mimetypes to exclude binary files where possible
-    (ftype, encoding) = mimetypes.guess_type(os.path.join(f['root'], f['fn']))
-    if encoding is not None:
-        return False
-    if ftype is not None and ftype.startswith('image'):
-        return False
+    # Compressed logs are matched on their name without the compression extension
+    compression = get_compression(fn)
+    match_fn = strip_compression(fn)
 
-    # Search pattern specific filesize limit
-    if pattern.get('max_filesize') is not None and 'filesize' in f:
-        if f['filesize'] > pattern.get('max_filesize'):
-            return False
+    # Check that we don't want to ignore this file
+    if search_index.is_ignored(fn) or search_index.is_ignored(match_fn):
+        logger.debug("Ignoring file as matched an ignore pattern: {}".format(fn))
+        return f, matched_keys, None
 
-    # Search by file name (glob)
-    if pattern.get('fn') is not None:
-        if fnmatch.fnmatch(f['fn'], pattern['fn']):
-            fn_matched = True
-            if pattern.get('contents') is None and pattern.get('contents_re') is None:
-                return True
+    # Check that this is a file and not a pipe or anything weird.
+    # The one stat call gets everything else we need to know as well.
+    try:
+        fstat = sf[2] if len(sf) > 2 else os.stat(os.path.join(root, fn))
+    except (IOError, OSError, ValueError, UnicodeDecodeError):
+        logger.debug("Couldn't read file when checking filesize: {}".format(fn))
+        return f, matched_keys, None
+    if not stat.S_ISREG(fstat.st_mode):
+        return f, matched_keys, None
 
-    # Search by file name (regex)
-    if pattern.get('fn_re') is not None:
-        if re.match( pattern['fn_re'], f['fn']):
-            fn_matched = True
-            if pattern.get('contents') is None and pattern.get('contents_re') is None:
-                return True
+    # Limit search to small files, to avoid 30GB FastQ files etc.
+    f['filesize'] = fstat.st_size
+    if f['filesize'] > config.log_filesize_limit:
+        return f, matched_keys, None
+
+    # Exclude compressed files and images by their file extension
+    if is_binary_filename(match_fn):
+        return f, matched_keys, None
+
+    # Skip the search if this file hasn't changed since the last run
+    fingerprint = (fstat.st_mtime, fstat.st_size, fstat.st_ino)
+    if search_cache is not None:
+        cached_keys = search_cache.lookup(search_cache.path_key(root, fn), fingerprint)
+        if cached_keys is not None:
+            return f, cached_keys, None
+
+    # Archives are searched like directories instead, unless a module looks for them by filename alone
+    path = os.path.join(root, fn)
+    if is_archive(fn):
+        return f, match_search_patterns(f, match_fn, path, io.BytesIO, filename_only=True), fingerprint
 
-    # Search by file contents
-    if pattern.get('contents') is not None or pattern.get('contents_re') is not None:
-        if pattern.get('contents_re') is not None:
-            repattern = re.compile(pattern['contents_re'])
+    matched_keys = match_search_patterns(f, match_fn, path, lambda: open_binary(path, compression))
+    return f, matched_keys, fingerprint
+
+def search_archive(sf):
+    """
+    Function applied to each archive that didn't match a search pattern
+    itself. Searches the files inside the archive as if it was a directory,
+    without extracting anything, and returns a list of (file dict, matched keys)
+    tuples for the members that matched. Member file dicts have the archive
+    path and member name under 'archive' and 'member', and a root of the
+    archive path plus the directory inside the archive.
+    Does not touch any global state, so can be run in a worker.
+    """
+    fn, root = sf
+    path = os.path.join(root, fn)
+    results = list()
+    if search_index.is_ignored(fn):
+        return results
+    ignore_dirs = compile_globs([n.rstrip(os.sep) for n in config.fn_ignore_dirs])
+    ignore_paths = compile_globs([n.rstrip(os.sep) for n in config.fn_ignore_paths])
+    try:
+        for member, size, opener in iter_archive_members(path):
+            mdir, _, mfn = member.rpartition('/')
+            mroot = os.path.normpath(os.path.join(path, mdir))
+            f = {'fn': mfn, 'root': mroot, 'filesize': size, 'archive': path, 'member': member}
+
+            # Apply the same ignore rules as for directories on disk
+            if ignore_dirs is not None and any(ignore_dirs.match(os.path.normcase(d)) for d in mdir.split('/') if d not in ('', '.')):
+                continue
+            if ignore_paths is not None and ignore_paths.match(os.path.normcase(mroot)):
+                continue
+            compression = get_compression(mfn)
+            match_fn = strip_compression(mfn)
+            if search_index.is_ignored(mfn) or search_index.is_ignored(match_fn):
+                continue
+            if size > config.log_filesize_limit or is_binary_filename(match_fn):
+                continue
+
+            member_path = os.path.join(path, member)
+            matched_keys = match_search_patterns(f, match_fn, member_path, lambda: decompress_stream(opener(), compression))
+            if len(matched_keys) > 0:
+                results.append((f, matched_keys))
+    except (read_errors + (tarfile.TarError, zipfile.BadZipfile)):
+        if config.report_readerrors:
+            logger.debug("Couldn't read archive when looking for output: {}".format(path))
+    return results
+
+def match_search_patterns(f, match_fn, path, opener, filename_only=False, index=None):
+    """
+    Test a file for each candidate search pattern, in priority order, and
+    return the list of search pattern keys that it matched. The file contents
+    are only read once, when first needed, and shared by all patterns.
+    Patterns that need the file contents are skipped if filename_only is set.
+    Uses the search patterns of the run, or index if given.
+    """
+    if index is None:
+        index = search_index
+    matched_keys = list()
+    candidates = index.candidates(match_fn)
+    if filename_only:
+        candidates = [sp for sp in candidates if sp['contents'] is None and sp['contents_re'] is None]
+    sniffed = SniffedFile(path, index.max_num_lines, index.full_scan_needles(candidates), opener)
+    try:
+        last_key = None
+        for sp in candidates:
+            # Only one pattern per search key can match
+            if sp['key'] == last_key:
+                continue
+            if sp['max_filesize'] is not None and f.get('filesize', 0) > sp['max_filesize']:
+                continue
+            if sp['contents'] is not None or sp['contents_re'] is not None:
+                if not index.search_contents(sp, sniffed):
+                    continue
+            # Check that we shouldn't exclude this file
+            if not index.is_excluded(sp, match_fn, sniffed):
+                # Looks good! Remember this file
+                matched_keys.append(sp['key'])
+            # Don't keep searching this file for other modules
+            if not sp['shared']:
+                break
+            # Don't look at other patterns for this module
+            last_key = sp['key']
+    finally:
+        sniffed.close()
+    return matched_keys
+
+class SearchCache(object):
+    """
+    On-disk SQLite cache of file search results. Records the search keys that
+    each file matched, along with its (mtime, size, inode) so that files that
+    haven't changed don't need to be searched again. Results are kept separately
+    for each signature (MultiQC version, modules and search patterns), so that
+    runs with different modules don't throw away each other's results. Results
+    for files that have gone are dropped when the cache is saved, and those for
+    signatures that haven't been used for max_age_days are dropped when it's loaded.
+    """
+
+    max_age_days = 30
+
+    def __init__(self, cache_fn, signature):
+        self.cache_fn = cache_fn
+        self.signature = signature
+        self.entries = dict()
+        self.new_entries = list()
+        self.seen = set()
+        self.roots = dict()
+        self.enabled = True
+        self.load()
+
+    def connect(self):
+        cache_dir = os.path.dirname(self.cache_fn)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        con = sqlite3.connect(self.cache_fn, timeout=60)
+        con.execute('CREATE TABLE IF NOT EXISTS signatures (signature TEXT PRIMARY KEY, last_used REAL)')
+        con.execute('CREATE TABLE IF NOT EXISTS results (signature TEXT, path TEXT, mtime REAL, size INTEGER, inode INTEGER, keys TEXT, PRIMARY KEY (signature, path))')
+        return con
+
+    def load(self):
         try:
-            with io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8') as f:
-                l = 1
-                for line in f:
-                    # Search by file contents (string)
-                    if pattern.get('contents') is not None:
-                        if pattern['contents'] in line:
-                            contents_matched = True
-                            if pattern.get('fn') is None and pattern.get('fn_re') is None:
-                                return True
-                            break
-                    # Search by file contents (regex)
-                    elif pattern.get('contents_re') is not None:
-                        if re.search(repattern, line):
-                            contents_matched = True
-                            if pattern.get('fn') is None and pattern.get('fn_re') is None:
-                                return True
-                            break
-                    # Break if we've searched enough lines for this pattern
-                    if pattern.get('num_lines') and l >= pattern.get('num_lines'):
-                        break
-                    l += 1
-        except (IOError, OSError, ValueError, UnicodeDecodeError):
-            if config.report_readerrors:
-                logger.debug("Couldn't read file when looking for output: {}".format(f['fn']))
-                return False
+            con = self.connect()
+            with con:
+                now = time.time()
+                cutoff = now - self.max_age_days * 24 * 60 * 60
+                old = con.execute('SELECT signature FROM signatures WHERE last_used < ?', (cutoff,)).fetchall()
+                if len(old) > 0:
+                    logger.debug("Removing {} unused search pattern signatures from file search cache: {}".format(len(old), self.cache_fn))
+                    con.executemany('DELETE FROM results WHERE signature = ?', old)
+                    con.execute('DELETE FROM signatures WHERE last_used < ?', (cutoff,))
+                con.execute('INSERT OR REPLACE INTO signatures (signature, last_used) VALUES (?, ?)', (self.signature, now))
+            query = 'SELECT path, mtime, size, inode, keys FROM results WHERE signature = ?'
+            for path, mtime, size, inode, keys in con.execute(query, (self.signature,)):
+                self.entries[path] = ((mtime, size, inode), keys)
+            con.close()
+            logger.debug("Loaded {} files from file search cache: {}".format(len(self.entries), self.cache_fn))
+        except (sqlite3.Error, IOError, OSError) as e:
+            logger.warning("Could not load file search cache, searching all files: {}".format(e))
+            self.entries = dict()
+            self.enabled = False
+
+    def path_key(self, root, fn):
+        """ Absolute path used as the cache key. Directory paths are memoised. """
+        try:
+            abs_root = self.roots[root]
+        except KeyError:
+            abs_root = self.roots[root] = os.path.abspath(root)
+        return os.path.join(abs_root, fn)
+
+    def lookup(self, path, fingerprint):
+        """ Returns the list of matched search keys, or None if not cached or the file has changed """
+        entry = self.entries.get(path)
+        if entry is None or tuple(entry[0]) != fingerprint:
+            return None
+        return json.loads(entry[1])
+
+    def add(self, path, fingerprint, keys):
+        self.new_entries.append((self.signature, path, fingerprint[0], fingerprint[1], fingerprint[2], json.dumps(keys)))
+
+    def add_seen(self, path):
+        """ Note that a file was found by the search in this run, whether or not it was cached """
+        self.seen.add(path)
 
-    return fn_matched and contents_matched
+    def save(self, searched_dirs=()):
+        """
+        Save the new results. Drops the results for files that weren't found in
+        this run, although they are inside one of searched_dirs, for every signature.
+        Also drops results for this signature for files that no longer exist.
+        """
+        if not self.enabled:
+            return
+        searched_dirs = tuple(os.path.join(os.path.abspath(d), '') for d in searched_dirs)
+        gone = [(self.signature, path) for path in self.entries if path not in self.seen
+                and (path.startswith(searched_dirs) or not os.path.exists(path))]
+        try:
+            con = self.connect()
+            with con:
+                con.executemany('INSERT OR REPLACE INTO results (signature, path, mtime, size, inode, keys) VALUES (?, ?, ?, ?, ?, ?)', self.new_entries)
+                for d in searched_dirs:
+                    query = 'SELECT signature, path FROM results WHERE signature != ? AND substr(path, 1, ?) = ?'
+                    gone.extend(r for r in con.execute(query, (self.signature, len(d), d)) if r[1] not in self.seen)
+                con.executemany('DELETE FROM results WHERE signature = ? AND path = ?', gone)
+            con.close()
+            logger.debug("Saved {} files to file search cache and removed {}: {}".format(len(self.new_entries), len(gone), self.cache_fn))
+        except (sqlite3.Error, IOError, OSError) as e:
+            logger.warning("Could not save file search cache: {}".format(e))
+        self.new_entries = list()
 
-def exclude_file(sp, f):
+class SearchPatternIndex(object):
     """
-    Exclude discovered files if they match the special exclude_
-    search pattern keys
+    Compiled version of the search patterns, built once per run.
+    Filename globs and regexes are merged into hash lookups (exact
+    filenames and simple '*suffix' globs) plus one combined regex, so
+    that each filename can be classified in one pass instead of
+    testing every pattern in turn.
     """
-    # Make everything a list if it isn't already
-    for k in sp:
-        if k in ['exclude_fn', 'exclude_fn_re' 'exclude_contents', 'exclude_contents_re']:
-            if not isinstance(sp[k], list):
-                sp[k] = [sp[k]]
 
-    # Search by file name (glob)
-    if 'exclude_fn' in sp:
-        for pat in sp['exclude_fn']:
-            if fnmatch.fnmatch(f['fn'], pat):
-                return True
+    def __init__(self, spatterns, ignore_files=()):
+        # Flatten the tiers into one list of patterns, in priority order
+        self.patterns = list()
+        self.contents_only = list()
+        self.fn_exact = defaultdict(list)
+        self.fn_suffix = defaultdict(list)
+        fn_other = list()
+        for tier in spatterns:
+            for key, sps in tier.items():
+                for sp in sps:
+                    idx = len(self.patterns)
+                    csp = self.compile_pattern(key, sp)
+                    self.patterns.append(csp)
+                    if sp.get('fn') is None and sp.get('fn_re') is None:
+                        if csp['contents'] is not None or csp['contents_re'] is not None:
+                            self.contents_only.append(idx)
+                        continue
+                    if sp.get('fn') is not None:
+                        glob = os.path.normcase(str(sp['fn']))
+                        if not any(c in glob for c in '*?['):
+                            self.fn_exact[glob].append(idx)
+                        elif len(glob) > 1 and glob.startswith('*') and not any(c in glob[1:] for c in '*?['):
+                            self.fn_suffix[glob[1:]].append(idx)
+                        else:
+                            fn_other.append((fnmatch.translate(glob), idx))
+                    if sp.get('fn_re') is not None:
+                        fn_other.append((sp['fn_re'], idx))
+        self.fn_suffix_lengths = sorted(set(len(sfx) for sfx in self.fn_suffix))
+        self.fn_other = [(re.compile(pat), idx) for pat, idx in fn_other]
+
+        # One regex for all of the awkward patterns, to rule them all out at once.
+        # Can't be done if the patterns contain global flags or named groups, so
+        # then each one is tested in turn.
+        try:
+            self.fn_other_any = re.compile('|'.join(['(?:{})'.format(pat) for pat, idx in fn_other]))
+        except re.error:
+            self.fn_other_any = None
+        if len(fn_other) == 0:
+            self.fn_other_any = None
+            self.fn_other = list()
+
+        # Longest file head that any pattern needs to look at
+        self.max_num_lines = max([sp['num_lines'] for sp in self.patterns if sp['num_lines']] or [0])
 
-    # Search by file name (regex)
-    if 'exclude_fn_re' in sp:
-        for pat in sp['exclude_fn_re']:
-            if re.match( pat, f['fn']):
+        # Files to ignore, as a single regex
+        self.ignore_files = compile_globs(list(ignore_files))
+
+    @staticmethod
+    def compile_pattern(key, sp):
+        """ Make a normalised copy of a single search pattern with compiled regexes """
+        def listify(v):
+            if v is None:
+                return []
+            return v if isinstance(v, list) else [v]
+        return {
+            'key': key,
+            'shared': sp.get('shared', False),
+            'max_filesize': sp.get('max_filesize'),
+            'num_lines': sp.get('num_lines'),
+            'contents': sp.get('contents'),
+            'contents_re': re.compile(sp['contents_re']) if sp.get('contents_re') is not None else None,
+            'exclude_fn': [re.compile(fnmatch.translate(os.path.normcase(pat))) for pat in listify(sp.get('exclude_fn'))],
+            'exclude_fn_re': [re.compile(pat) for pat in listify(sp.get('exclude_fn_re'))],
+            'exclude_contents': listify(sp.get('exclude_contents')),
+            'exclude_contents_re': [re.compile(pat) for pat in listify(sp.get('exclude_contents_re'))]
+        }
+
+    def is_ignored(self, fn):
+        """ Check a filename against config.fn_ignore_files """
+        return self.ignore_files is not None and self.ignore_files.match(os.path.normcase(fn)) is not None
+
+    def candidates(self, fn):
+        """
+        Returns the compiled search patterns that could match a file with
+        this filename, in priority order. That's every pattern with a
+        matching fn / fn_re, plus every pattern that only looks at contents.
+        """
+        nfn = os.path.normcase(fn)
+        idxs = list(self.contents_only)
+        idxs.extend(self.fn_exact.get(nfn, []))
+        for l in self.fn_suffix_lengths:
+            idxs.extend(self.fn_suffix.get(nfn[-l:], []))
+        if len(self.fn_other) > 0:
+            if self.fn_other_any is None or self.fn_other_any.match(nfn):
+                idxs.extend([idx for regex, idx in self.fn_other if regex.match(nfn)])
+        return [self.patterns[idx] for idx in sorted(set(idxs))]
+
+    @staticmethod
+    def full_scan_needles(patterns):
+        """
+        Returns all strings and regexes from these patterns that need
+        to be searched for through the whole file, not just its head.
+        """
+        needles = list()
+        for sp in patterns:
+            if not sp['num_lines']:
+                if sp['contents'] is not None:
+                    needles.append(sp['contents'])
+                elif sp['contents_re'] is not None:
+                    needles.append(sp['contents_re'])
+            needles.extend(sp['exclude_contents'])
+            needles.extend(sp['exclude_contents_re'])
+        return needles
+
+    @staticmethod
+    def search_contents(sp, sniffed):
+        """ Search the contents of a file for a compiled search pattern """
+        needle = sp['contents'] if sp['contents'] is not None else sp['contents_re']
+        return sniffed.contains(needle, sp['num_lines'])
+
+    @staticmethod
+    def is_excluded(sp, fn, sniffed):
+        """
+        Exclude discovered files if they match the special exclude_
+        search pattern keys
+        """
+        nfn = os.path.normcase(fn)
+        if any(pat.match(nfn) for pat in sp['exclude_fn']):
+            return True
+        if any(pat.match(fn) for pat in sp['exclude_fn_re']):
+            return True
+        for needle in sp['exclude_contents'] + sp['exclude_contents_re']:
+            if sniffed.contains(needle):
                 return True
+        return False
 
-    # Search the contents of the file
-    if 'exclude_contents' in sp or 'exclude_contents_re' in sp:
-        # Compile regex patterns if we have any
-        if 'exclude_contents_re' in sp:
-            sp['exclude_contents_re'] = [re.compile(pat) for pat in sp['exclude_contents_re']]
-        with io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8') as fh:
-            for line in fh:
-                if 'exclude_contents' in sp:
-                    for pat in sp['exclude_contents']:
-                        if pat in line:
-                            return True
-                if 'exclude_contents_re' in sp:
-                    for pat in sp['exclude_contents_re']:
-                        if re.search(pat, line):
-                            return True
-    return False
+class SniffedFile(object):
+    """
+    Contents of a file under test, read at most once and shared between
+    all search patterns. The first max_num_lines lines are kept in memory.
+    Patterns without num_lines need the whole file, so these are all
+    searched for together in a single streaming pass the first time that
+    one of them is needed. The file is opened with opener if given, so that
+    compressed files and archive members can be streamed in the same way.
+    """
+
+    def __init__(self, path, max_num_lines, full_scan_needles, opener=None):
+        self.path = path
+        self.opener = opener
+        self.max_num_lines = max_num_lines
+        self.full_scan_needles = full_scan_needles
+        self.lines = None
+        self.complete = False
+        self.binary = None
+        self.fh = None
+        self.full_scan_found = None
+
+    @staticmethod
+    def line_match(needle, line):
+        if hasattr(needle, 'search'):
+            return needle.search(line) is not None
+        return needle in line
+
+    def read_head(self):
+        """
+        Read the first max_num_lines lines of the file into memory. Binary files
+        are recognised from their first few bytes and are never decoded as text.
+        """
+        self.lines = list()
+        try:
+            self.fh = self.opener() if self.opener is not None else io.open(self.path, 'rb')
+            if config.filesearch_magic and hasattr(self.fh, 'peek'):
+                self.binary = sniff_magic(self.fh.peek(8)[:8])
+                if self.binary is not None:
+                    logger.debug("Not searching contents of {} file: {}".format(self.binary, self.path))
+                    self.complete = True
+                    self.close()
+                    return
+            self.fh = text_reader(self.fh)
+            for line in self.fh:
+                self.lines.append(line)
+                if len(self.lines) >= self.max_num_lines:
+                    break
+            else:
+                self.complete = True
+        except read_errors:
+            if config.report_readerrors:
+                logger.debug("Couldn't read file when looking for output: {}".format(self.path))
+            self.complete = True
+        if self.complete:
+            self.close()
+
+    def full_scan(self):
+        """
+        Stream through the rest of the file once, looking for every full-scan
+        needle that wasn't in the head. Returns the set of needles found.
+        """
+        if self.full_scan_found is None:
+            self.full_scan_found = set()
+            needles = [n for n in self.full_scan_needles if not any(self.line_match(n, l) for l in self.lines)]
+            try:
+                if self.fh is not None and len(needles) > 0:
+                    for line in self.fh:
+                        for n in [n for n in needles if self.line_match(n, line)]:
+                            self.full_scan_found.add(n)
+                            needles.remove(n)
+                        if len(needles) == 0:
+                            break
+            except read_errors:
+                if config.report_readerrors:
+                    logger.debug("Couldn't read file when looking for output: {}".format(self.path))
+            self.close()
+        return self.full_scan_found
+
+    def contains(self, needle, num_lines=None):
+        """
+        Check whether a string or compiled regex is found in the file.
+        Only the first num_lines lines are searched if given.
+        """
+        if self.lines is None:
+            self.read_head()
+        head = self.lines if not num_lines else self.lines[:num_lines]
+        if any(self.line_match(needle, l) for l in head):
+            return True
+        if num_lines or self.complete:
+            return False
+        return needle in self.full_scan()
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+def search_pattern_files(sp):
+    """
+    Find the searched files that match a single search pattern dict, for the old
+    style of find_log_files() that is given a search pattern instead of a key.
+    Uses the same compiled matching and shared file head as the main file search.
+    Returns a list of file dicts with fn and root.
+    """
+    index = SearchPatternIndex([{'search_pattern': [sp]}])
+    found = list()
+    for sf in searchfiles:
+        fn, root = sf[0], sf[1]
+        match_fn = strip_compression(fn)
+        # Exclude compressed files and images by their file extension
+        if is_binary_filename(match_fn):
+            continue
+        path = os.path.join(root, fn)
+        try:
+            fstat = sf[2] if len(sf) > 2 else os.stat(path)
+        except (IOError, OSError, ValueError, UnicodeDecodeError):
+            continue
+        if not stat.S_ISREG(fstat.st_mode):
+            continue
+        f = {'fn': fn, 'root': root, 'filesize': fstat.st_size}
+        opener = functools.partial(open_binary, path, get_compression(fn))
+        if len(match_search_patterns(f, match_fn, path, opener, index=index)) > 0:
+            found.append({'fn': fn, 'root': root})
+    return found
 
 def data_sources_tofile ():
     fn = 'multiqc_sources.{}'.format(config.data_format_extensions[config.data_format])
@@ -362,10 +1315,65 @@ def save_htmlid(html_id, skiplint=False):
     return html_id_clean
 
 
-def compress_json(data):
-    """ Take a Python data object. Convert to JSON and compress using lzstring """
+def compress_json(data, encoding='lzstring'):
+    """
+    Take a Python data object. Convert to JSON and compress it with one of
+    the plot_data_encoders, lzstring by default.
+    """
     json_string = json.dumps(data).encode('utf-8', 'ignore').decode('utf-8')
-    # JSON.parse() doesn't handle `NaN`, but it does handle `null`.
-    json_string = json_string.replace('NaN', 'null');
+    # JSON.parse() doesn't handle `NaN`, but it does handle `null`. Only replace NaN
+    # values, not NaN inside other text such as the base64 of packed columnar data.
+    json_string = re.sub(r'NaN(?<=[\[ ]NaN)(?=[,\]}])', 'null', json_string)
+    return plot_data_encoders[encoding](json_string)
+
+def compress_plot_data(plot_data, encoding='lzstring', pack=False, num_workers=1):
+    """
+    Compress the data for each plot separately with compress_json(), so that the
+    report only needs to decompress a plot when it is shown. Line graphs and bar
+    graphs are packed with columnar.pack_plot_data() first if pack is True.
+    Uses a pool of num_workers processes if more than one and new processes
+    can be forked, otherwise compresses the plots one after another.
+    :return: OrderedDict of the compressed data for each plot ID
+    """
+    from multiqc.utils import module_runner # Imports this module
+    tasks = [(pid, plot_data[pid], encoding, pack) for pid in plot_data]
+    ctx = None
+    if num_workers is not None and num_workers > 1 and len(tasks) > 1:
+        ctx = module_runner.fork_context()
+    if ctx is None:
+        return OrderedDict(compress_plot_chunk(t) for t in tasks)
+    logger.debug("Compressing {} plots using {} processes".format(len(tasks), num_workers))
+    pool = ctx.Pool(num_workers)
+    try:
+        chunks = OrderedDict(pool.map(compress_plot_chunk, tasks, 1))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return chunks
+
+def compress_plot_chunk(task):
+    """ Compress the data for one plot, for compress_plot_data(). Returns the plot ID and compressed data. """
+    pid, plot, encoding, pack = task
+    if pack:
+        plot = columnar.pack_plot_data({pid: plot})[pid]
+    return pid, compress_json(plot, encoding)
+
+def encode_lzstring(json_string):
+    """ Compress a string with lzstring, as base64 """
     x = lzstring.LZString()
     return x.compressToBase64(json_string)
+
+def encode_zlib(json_string):
+    """ Compress a string with zlib (deflate), as base64 """
+    return base64.b64encode(zlib.compress(json_string.encode('utf-8'))).decode('ascii')
+
+# Ways to compress the plot data, by the name used for config.plot_data_encoding.
+# Each takes a JSON string and returns ASCII text, which is decoded in the report
+# by the function with the same name in mqc_plotdata_decoders (multiqc_plotting.js)
+plot_data_encoders = OrderedDict([
+    ('lzstring', encode_lzstring),
+    ('zlib', encode_zlib)
+])
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+""" MultiQC tabular file reader. Reads big delimited files of numbers, such as
+coverage tables, straight into NumPy arrays. Plain files are memory mapped and
+each block of lines is split into fields and parsed with NumPy, without making
+a Python string or float for every line and value, so this is much faster and
+uses much less memory than splitting each line. """
+
+from __future__ import print_function
+import io
+import mmap
+import os
+import warnings
+
+import numpy as np
+
+from multiqc.utils import report
+
+# How much of the file to parse at once. Parsing uses several times this much memory.
+block_size = 1024 * 1024
+
+def read_table(f, numeric_cols, text_cols=(), delimiter='\t', comment='#', num_header_lines=0):
+    """
+    Read a delimited file of numbers, found by find_log_files(..., filecontents=False).
+    The file starts with num_header_lines header lines, then any number of header lines
+    beginning with comment, and every other line must have the same number of fields.
+    Compressed files and files inside archives are read a block at a time instead of
+    being memory mapped.
+    :param f: File dict from find_log_files()
+    :param numeric_cols: List of indexes, or a slice, of the columns to parse as floats
+    :param text_cols: List of indexes of columns to return as bytes, such as chromosome names
+    :param delimiter: Field delimiter, a single character
+    :param comment: Character that starts the header lines, or None
+    :param num_header_lines: Number of header lines, whatever they start with
+    :return: Tuple of the header lines as a list of strings, without line endings,
+             a 2D float array with a row for each line and a column for each of
+             numeric_cols, and a list with a bytes array for each of text_cols
+    :raises ValueError: if a line has the wrong number of fields, or a numeric field
+                        isn't a number
+    """
+    header = list()
+    parsed = list(iter_table(f, numeric_cols, text_cols, delimiter, comment, num_header_lines, header))
+    if len(parsed) == 0:
+        num_cols = 0 if isinstance(numeric_cols, slice) else len(numeric_cols)
+        return header, np.empty((0, num_cols)), [np.empty(0, dtype='S1') for c in text_cols]
+    values = np.concatenate([p[0] for p in parsed])
+    text = [np.concatenate([p[1][i] for p in parsed]) for i in range(len(text_cols))]
+    return header, values, text
+
+def iter_table(f, numeric_cols, text_cols=(), delimiter='\t', comment='#', num_header_lines=0, header=None):
+    """
+    Generator that reads a file like read_table(), but yields the values and text
+    columns for each block of lines in turn, so that files can be summarised without
+    holding all of their values in memory. The header lines are added to the header
+    list, if given, before the first block is yielded.
+    """
+    if header is None:
+        header = list()
+    with open_blocks(f) as blocks:
+        columns = None
+        for block in blocks:
+            if columns is None:
+                # Read the header lines from the start of the first block
+                buf = np.frombuffer(block, dtype=np.uint8)
+                line_ends = np.flatnonzero(buf == ord('\n'))
+                start = 0
+                for end in line_ends:
+                    if len(header) >= num_header_lines and (comment is None or buf[start] != ord(comment)):
+                        break
+                    header.append(to_bytes(block[start:end]).rstrip(b'\r').decode('utf-8'))
+                    start = end + 1
+                if start == len(buf):
+                    continue # Only header lines so far
+                end = line_ends[np.searchsorted(line_ends, start)]
+                ncols = int(np.count_nonzero(buf[start:end] == ord(delimiter))) + 1
+                columns = resolve_cols(numeric_cols, ncols)
+                block = block[start:]
+                buf = None
+            parsed = parse_block(block, ncols, columns, text_cols, ord(delimiter))
+            block = None # Let the memory map close
+            yield parsed
+
+def resolve_cols(cols, ncols):
+    """ Column indexes from a list or a slice, for a file with ncols columns """
+    if isinstance(cols, slice):
+        return list(range(ncols))[cols]
+    for c in cols:
+        if c >= ncols:
+            raise ValueError("Column {} requested, but the file only has {} columns".format(c, ncols))
+    return list(cols)
+
+class open_blocks(object):
+    """
+    Context manager giving an iterator over blocks of a file that each end at
+    the end of a line. Blocks of plain files are views of a memory map, where
+    the pages can be dropped from memory once they have been parsed.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.fh = None
+        self.mm = None
+
+    def __enter__(self):
+        if 'archive' in self.f or report.get_compression(self.f['fn']) is not None:
+            self.fh = report.open_log_file(self.f, binary=True)
+            return self.stream_blocks()
+        self.fh = io.open(os.path.join(self.f['root'], self.f['fn']), 'rb')
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            # Mapped pages can't be dropped before Python 3.8 or on Windows,
+            # so read blocks instead of keeping the whole file in memory
+            return self.stream_blocks()
+        if os.fstat(self.fh.fileno()).st_size == 0:
+            return iter([])
+        self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mmap_blocks()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                pass # Still in use by a traceback, closed when that is freed
+        if self.fh is not None:
+            self.fh.close()
+
+    def mmap_blocks(self):
+        start = 0
+        size = len(self.mm)
+        view = memoryview(self.mm)
+        while start < size:
+            end = self.mm.find(b'\n', min(start + block_size, size) - 1)
+            end = size if end == -1 else end + 1
+            yield end_line(view[start:end])
+            # Drop the pages that have been parsed, so that the file isn't all kept in memory
+            first_page = start - start % mmap.PAGESIZE
+            last_page = end - end % mmap.PAGESIZE
+            if last_page > first_page:
+                self.mm.madvise(mmap.MADV_DONTNEED, first_page, last_page - first_page)
+            start = end
+        view.release()
+
+    def stream_blocks(self):
+        leftover = b''
+        while True:
+            data = self.fh.read(block_size)
+            if not data:
+                break
+            data = leftover + data
+            end = data.rfind(b'\n') + 1
+            leftover = data[end:]
+            if end > 0:
+                yield data[:end]
+        if leftover:
+            yield end_line(leftover)
+
+def to_bytes(block):
+    """ Copy a memoryview to bytes """
+    if isinstance(block, memoryview):
+        return block.tobytes()
+    return block
+
+def end_line(block):
+    """ Make sure that a block ends with a newline, copying it if not """
+    if to_bytes(block[-1:]) == b'\n':
+        return block
+    return to_bytes(block) + b'\n'
+
+def parse_block(block, ncols, columns, text_cols, delimiter):
+    """
+    Parse a block of complete lines, as bytes or a memoryview. Returns a 2D float
+    array of the numeric columns and a list of bytes arrays of the text columns.
+    """
+    buf = np.frombuffer(block, dtype=np.uint8)
+    is_nl = buf == ord('\n')
+    nl_pos = np.flatnonzero(is_nl)
+    line_starts = np.concatenate(([0], nl_pos[:-1] + 1))
+
+    # The end of every field, skipping blank lines
+    blank = (nl_pos == line_starts) | ((nl_pos == line_starts + 1) & (buf[nl_pos - 1] == ord('\r')))
+    ends = np.flatnonzero(is_nl | (buf == delimiter))
+    if blank.any():
+        ends = np.setdiff1d(ends, nl_pos[blank], assume_unique=True)
+        line_starts = line_starts[~blank]
+
+    # Check that every line has all of the fields
+    num_lines = len(line_starts)
+    if len(ends) != num_lines * ncols or not (buf[ends.reshape(num_lines, ncols)[:, -1]] == ord('\n')).all():
+        line_fields = np.diff(np.concatenate(([-1], np.flatnonzero(buf[ends] == ord('\n')))))
+        bad = np.flatnonzero(line_fields != ncols)[0]
+        line_end = nl_pos[~blank][bad]
+        raise ValueError("Line has {} fields instead of {}: '{}'".format(line_fields[bad], ncols,
+            to_bytes(block[line_starts[bad]:line_end]).decode('utf-8', 'replace')))
+    ends = ends.reshape(num_lines, ncols)
+    starts = np.empty_like(ends)
+    starts[:, 0] = line_starts
+    starts[:, 1:] = ends[:, :-1] + 1
+    # Don't include carriage returns in the last field
+    ends[:, -1] -= buf[ends[:, -1] - 1] == ord('\r')
+
+    # Blank out everything except the numeric fields and parse what's left
+    cols = sorted(columns)
+    edges = np.zeros(len(buf) + 1, dtype=np.int8)
+    edges[starts[:, cols]] = 1
+    edges[ends[:, cols]] -= 1
+    in_field = np.cumsum(edges[:-1], dtype=np.int8).view(bool)
+    numbers = np.where(in_field, buf, ord(' ')).astype(np.uint8).tobytes()
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            values = np.fromstring(numbers, dtype=float, sep=' ')
+        except (DeprecationWarning, ValueError):
+            values = None
+    if values is None or len(values) != num_lines * len(cols):
+        raise ValueError("Found a missing or non-numeric value in columns {}".format(columns))
+    values = values.reshape(num_lines, len(cols))
+    # Values are in file order, so put the columns in the order that they were asked for
+    values = values[:, [cols.index(c) for c in columns]]
+
+    # Copy each text field into a fixed width bytes array
+    text = list()
+    for c in text_cols:
+        lengths = ends[:, c] - starts[:, c]
+        width = max(1, int(lengths.max())) if num_lines > 0 else 1
+        idx = starts[:, c, None] + np.arange(width)
+        chars = np.where(idx < ends[:, c, None], buf[np.minimum(idx, len(buf) - 1)], 0).astype(np.uint8)
+        text.append(chars.view('S{}'.format(width)).reshape(num_lines))
+    return values, text
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+
+""" MultiQC worker. Keeps MultiQC loaded in a long-running process and makes
+a report for each job that it is sent, so that making lots of reports doesn't
+pay the cost of starting MultiQC every time. Run with `python -m multiqc.worker`.
+
+Jobs are JSON objects, one per line, read from stdin or from clients of a unix socket:
+
+    {"id": "project_1", "analysis_dir": ["/data/project_1"], "options": {"outdir": "/reports/project_1", "force": true}}
+
+The options are the arguments to multiqc.run(). A line of JSON is written back
+for each job when it finishes, which may not be in the order that they were sent:
+
+    {"id": "project_1", "sys_exit_code": 0, "report": "/reports/project_1/multiqc_report.html"}
+"""
+
+from __future__ import print_function
+import click
+import importlib
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import traceback
+
+from multiqc import multiqc
+from multiqc.utils import config, log, module_runner, util_functions
+logger = config.logger
+
+def preload():
+    """
+    Load everything that each job would otherwise load for itself: the modules,
+    the libraries that MultiQC only imports when they're first used, and the
+    config. Templates aren't loaded, as they can change the config when they
+    are imported.
+    """
+    for name, entry_point in config.avail_modules.items():
+        try:
+            entry_point.load()
+        except Exception as e:
+            logger.debug("Couldn't load module '{}': {}".format(name, e))
+    try:
+        from multiqc.plots import bargraph, linegraph
+        bargraph.load_matplotlib()
+        linegraph.load_matplotlib()
+        # Only imported so that it's already loaded when jobs need it
+        importlib.import_module('numpy')
+    except ImportError as e:
+        logger.debug("Couldn't preload plotting libraries: {}".format(e))
+    config.get_git_hash()
+    config.reset()
+
+def parse_job(line):
+    """ Parse a job from a line of JSON. Returns the job and an error message, if any """
+    try:
+        job = json.loads(line)
+        assert isinstance(job, dict)
+        assert 'analysis_dir' in job
+    except (ValueError, AssertionError):
+        return None, "Couldn't understand job: {}".format(line.strip())
+    return job, None
+
+def run_job(job):
+    """ Make the report for a job. Returns the result to send back """
+    result = {'id': job.get('id')}
+    try:
+        multiqc_run = multiqc.run(job['analysis_dir'], **job.get('options', {}))
+        result['sys_exit_code'] = multiqc_run['sys_exit_code']
+        output_fn = getattr(multiqc_run['config'], 'output_fn', None)
+        if isinstance(output_fn, str):
+            result['report'] = os.path.realpath(output_fn)
+    except SystemExit as e:
+        result['sys_exit_code'] = e.code if isinstance(e.code, int) else 1
+    except Exception as e:
+        logger.error("Job {} failed:\n{}".format(job.get('id'), traceback.format_exc()))
+        result['sys_exit_code'] = 1
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    return result
+
+def job_process(job, conn):
+    """ Make the report for a job in its own process and send back the result """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Keep anything that MultiQC prints away from the results on stdout
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    conn.send(run_job(job))
+    conn.close()
+
+class JobSource(object):
+    """ Somewhere that jobs are read from, and their results are sent back to """
+
+    def __init__(self, fd, respond, close=None):
+        self.fd = fd
+        self.respond = respond
+        self.close = close
+        self.buffer = b''
+        self.open = True
+        self.num_running = 0 # Jobs waiting or running
+
+    def fileno(self):
+        return self.fd
+
+    def read_lines(self):
+        """ Read what's available and return any complete lines """
+        data = os.read(self.fd, 65536)
+        if len(data) == 0:
+            self.open = False
+            data = b'\n'
+        self.buffer += data
+        lines = self.buffer.split(b'\n')
+        self.buffer = lines.pop()
+        return [l.decode('utf-8') for l in lines if l.strip()]
+
+    def send(self, result):
+        try:
+            self.respond((json.dumps(result) + '\n').encode('utf-8'))
+        except (IOError, OSError) as e:
+            logger.warning("Couldn't send result for job {}: {}".format(result.get('id'), e))
+
+    def finished(self):
+        return not self.open and self.num_running == 0
+
+def serve(num_jobs, socket_path=None):
+    """
+    Read jobs from stdin or a unix socket and make a report for each one, running
+    up to num_jobs at the same time. Each job runs in a new process forked from
+    this one, so starts with everything already loaded and leaves nothing behind.
+    Returns when stdin is closed and all jobs have finished, or runs until killed
+    if listening on a socket.
+    """
+    stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+    def write_stdout(data):
+        stdout.write(data)
+        stdout.flush()
+
+    ctx = module_runner.fork_context()
+    if ctx is None:
+        if socket_path is not None:
+            raise click.UsageError("Can't listen on a socket on this platform")
+        logger.warning("Can't run jobs in separate processes on this platform, running them one at a time")
+        source = JobSource(None, write_stdout)
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            job, error = parse_job(line)
+            if error is not None:
+                source.send({'id': None, 'sys_exit_code': 1, 'error': error})
+                continue
+            # Keep anything that MultiQC prints away from the results on stdout
+            sys.stdout = sys.stderr
+            try:
+                source.send(run_job(job))
+            finally:
+                sys.stdout = sys.__stdout__
+        return
+
+    sources = list()
+    server = None
+    if socket_path is None:
+        sources.append(JobSource(sys.stdin.fileno(), write_stdout))
+    else:
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen(5)
+        logger.info("Listening for jobs on {}".format(socket_path))
+
+    pending = list() # Jobs waiting for a free slot, with their source
+    running = dict() # Pipe to each running job, with its process and source
+    try:
+        while len(sources) > 0 or len(pending) > 0 or len(running) > 0 or server is not None:
+            # Start as many jobs as we can
+            while len(pending) > 0 and len(running) < num_jobs:
+                job, source = pending.pop(0)
+                parent_conn, child_conn = ctx.Pipe(duplex=False)
+                p = ctx.Process(target=job_process, args=(job, child_conn))
+                p.start()
+                child_conn.close()
+                running[parent_conn] = (job, p, source)
+
+            # Close clients that have sent all of their jobs and had all of their results
+            for source in [s for s in sources if s.finished()]:
+                sources.remove(source)
+                if source.close is not None:
+                    source.close()
+
+            # Wait for a job to finish or a new job to arrive. Only read more jobs
+            # when there is a free slot, so that the sender can tell we're busy.
+            readers = list(running.keys())
+            if len(pending) == 0:
+                readers.extend([s for s in sources if s.open])
+                if server is not None:
+                    readers.append(server)
+            if len(readers) == 0:
+                continue
+            ready, _, _ = select.select(readers, [], [])
+            for r in ready:
+                if r is server:
+                    client, _ = server.accept()
+                    sources.append(JobSource(client.fileno(), client.sendall, client.close))
+                elif r in running:
+                    job, p, source = running.pop(r)
+                    try:
+                        result = r.recv()
+                    except EOFError:
+                        result = {'id': job.get('id'), 'sys_exit_code': 1, 'error': 'MultiQC process died'}
+                    r.close()
+                    p.join()
+                    source.num_running -= 1
+                    source.send(result)
+                else:
+                    try:
+                        lines = r.read_lines()
+                    except (IOError, OSError):
+                        r.open = False
+                        lines = list()
+                    for line in lines:
+                        job, error = parse_job(line)
+                        if error is not None:
+                            r.send({'id': None, 'sys_exit_code': 1, 'error': error})
+                        else:
+                            r.num_running += 1
+                            pending.append((job, r))
+    finally:
+        for job, p, source in running.values():
+            p.terminate()
+        if server is not None:
+            server.close()
+            os.remove(socket_path)
+
+@click.command(
+    context_settings = dict( help_option_names = ['-h', '--help'] )
+)
+@click.option('-j', '--jobs', 'num_jobs',
+                    type = int,
+                    default = 1,
+                    help = "Number of reports to make at the same time (default: 1)"
+)
+@click.option('-s', '--socket', 'socket_path',
+                    type = click.Path(),
+                    help = "Listen for jobs on this unix socket instead of reading them from stdin"
+)
+def run_worker(num_jobs, socket_path):
+    """MultiQC worker. Makes a MultiQC report for each job it is sent, without starting MultiQC each time.
+
+        Jobs are read from stdin (or from a unix socket with --socket), one JSON object per line:
+
+        {"id": "p1", "analysis_dir": ["/data/p1"], "options": {"outdir": "/reports/p1"}}
+
+        The options are the same as the command line options, named as in multiqc.run().
+        A line of JSON with the id, exit code and report path is written back for each job.
+    """
+    log.init_log(logger, loglevel='INFO')
+    preload()
+    # Stop running jobs and clean up when killed
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        serve(max(1, num_jobs), socket_path)
+    except KeyboardInterrupt:
+        logger.critical("Stopping MultiQC worker")
+        sys.exit(1)
+    finally:
+        util_functions.robust_rmtree(log.log_tmp_dir)
+
+if __name__ == "__main__":
+    run_worker()
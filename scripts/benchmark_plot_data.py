@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+""" Benchmark how long MultiQC takes to compress the report plot data.
+
+Times report.compress_json() with each of the plot data encodings, including
+making the JSON, and prints the size of the compressed data. Uses the plot data
+from the multiqc_data.json file written by an earlier run, or made up line
+graphs and a bar graph for a number of samples.
+
+With --columnar, the line graphs and bar graphs are packed first, as with
+`plot_data_columnar`. With --chunks, each plot is compressed separately with
+report.compress_plot_data(), as with `plot_data_chunks`, using --workers processes.
+
+    python scripts/benchmark_plot_data.py --samples 2000
+    python scripts/benchmark_plot_data.py --data multiqc_data/multiqc_data.json --columnar
+    python scripts/benchmark_plot_data.py --plots 20 --chunks --workers 4
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from multiqc.utils import report, columnar
+
+def made_up_plot_data(num_samples, num_points, num_plots=1):
+    """ Plot data shaped like that of linegraph.plot() and bargraph.plot() """
+    rand = random.Random(1)
+    names = ['sample_{}'.format(i) for i in range(num_samples)]
+    bars = [{'name': c, 'data': [rand.randint(0, 10000000) for s in names]} for c in ('Unique', 'Duplicate', 'Unmapped')]
+    plot_data = {
+        'benchmark_bar': {'plot_type': 'bar_graph', 'samples': [names], 'datasets': [bars], 'config': {'id': 'benchmark_bar'}}
+    }
+    for i in range(num_plots):
+        pid = 'benchmark_line_{}'.format(i)
+        line = [{'name': s, 'data': [[x, round(rand.gauss(30, 5), 2)] for x in range(1, num_points + 1)]} for s in names]
+        plot_data[pid] = {'plot_type': 'xy_line', 'datasets': [line], 'config': {'id': pid}}
+    return plot_data
+
+def time_encoding(data, encoding, repeats, pack, chunks, workers):
+    """ Compress the data a number of times. Returns the time that each run took and the size of the last output """
+    times = list()
+    size = None
+    for i in range(repeats):
+        start = time.time()
+        if chunks:
+            size = sum(len(c) for c in report.compress_plot_data(data, encoding, pack, workers).values())
+        else:
+            size = len(report.compress_json(columnar.pack_plot_data(data) if pack else data, encoding))
+        times.append(time.time() - start)
+    return times, size
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2 == 0:
+        return (values[mid - 1] + values[mid]) / 2.0
+    return values[mid]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark how long MultiQC takes to compress the report plot data")
+    parser.add_argument('--data', help="multiqc_data.json file to take the plot data from")
+    parser.add_argument('-s', '--samples', type=int, default=500, help="Number of made up samples (default: 500)")
+    parser.add_argument('-p', '--points', type=int, default=100, help="Number of points in each made up line (default: 100)")
+    parser.add_argument('--plots', type=int, default=1, help="Number of made up line graphs (default: 1)")
+    parser.add_argument('-e', '--encoding', action='append', choices=list(report.plot_data_encoders),
+                        help="Encoding to benchmark, can be given more than once (default: all)")
+    parser.add_argument('-c', '--columnar', action='store_true', help="Pack the line graphs and bar graphs first")
+    parser.add_argument('--chunks', action='store_true', help="Compress each plot separately")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="Number of processes to use with --chunks (default: 1)")
+    parser.add_argument('-n', '--repeats', type=int, default=3, help="Number of times to compress the data (default: 3)")
+    args = parser.parse_args()
+
+    if args.data is not None:
+        with open(args.data) as fh:
+            data = json.load(fh)['report_plot_data']
+    else:
+        data = made_up_plot_data(args.samples, args.points, args.plots)
+    start = time.time()
+    json_size = len(json.dumps(data))
+    print("{} plots, {:.1f} MB of JSON, taking {:.3f}s to make".format(len(data), json_size / 1e6, time.time() - start))
+
+    for encoding in args.encoding or report.plot_data_encoders:
+        times, size = time_encoding(data, encoding, args.repeats, args.columnar, args.chunks, args.workers)
+        print("{:<10} median {:.3f}s, min {:.3f}s, max {:.3f}s, {:.1f} MB ({:.1%} of the JSON)".format(
+            encoding, median(times), min(times), max(times), size / 1e6, size / float(json_size)))
+
+if __name__ == "__main__":
+    main()
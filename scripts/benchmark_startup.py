@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+""" Benchmark how long MultiQC takes to start up.
+
+Times `multiqc --version` and importing MultiQC with its plotting code, each
+in a fresh Python process, and checks that the slow libraries which are only
+needed for some reports aren't imported before they're used. Exits with an
+error if any of them are, or if startup takes longer than --max-seconds.
+
+    python scripts/benchmark_startup.py --repeats 10 --max-seconds 1
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Libraries that should only be imported when they're needed
+LAZY_LIBRARIES = ['matplotlib', 'numpy', 'requests', 'pkg_resources']
+
+IMPORT_CODE = """
+import json, sys
+from multiqc import multiqc
+from multiqc.plots import bargraph, linegraph, table
+from multiqc.utils import mqc_colour
+print(json.dumps([m for m in {} if m in sys.modules]))
+""".format(LAZY_LIBRARIES)
+
+def time_command(cmd, repeats):
+    """ Run a command a number of times. Returns the time that each run took and the last output """
+    times = list()
+    output = None
+    for i in range(repeats):
+        start = time.time()
+        output = subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
+        times.append(time.time() - start)
+    return times, output
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2 == 0:
+        return (values[mid - 1] + values[mid]) / 2.0
+    return values[mid]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark how long MultiQC takes to start up")
+    parser.add_argument('-n', '--repeats', type=int, default=5, help="Number of times to run each command (default: 5)")
+    parser.add_argument('--max-seconds', type=float, help="Fail if the median startup time is more than this")
+    args = parser.parse_args()
+
+    env_python = [sys.executable, '-W', 'ignore']
+    repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    os.chdir(repo_dir)
+
+    failed = False
+    benchmarks = [
+        ('version', env_python + ['-m', 'multiqc', '--version']),
+        ('import', env_python + ['-c', IMPORT_CODE])
+    ]
+    for name, cmd in benchmarks:
+        times, output = time_command(cmd, args.repeats)
+        print("{:<10} median {:.3f}s, min {:.3f}s, max {:.3f}s".format(name, median(times), min(times), max(times)))
+        if args.max_seconds is not None and median(times) > args.max_seconds:
+            print("  Slower than {:.3f}s".format(args.max_seconds))
+            failed = True
+        if name == 'import':
+            imported = json.loads(output.strip().splitlines()[-1])
+            if len(imported) > 0:
+                print("  Imported on startup: {}".format(', '.join(imported)))
+                failed = True
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+""" Benchmark how long MultiQC takes to build the HTML for a table.
+
+Times making the table_object.datatable, which works out the colour scale
+ranges, and table.make_table(), which writes the HTML, for a made up table of
+numbers, with a few columns of PASS / WARN / FAIL text that get conditional
+formatting. Half of the numeric columns have no min and max, so these are
+found from the data, and some have a modify function, like general stats
+read counts. Prints the time for each and how many cells are made per second.
+
+    python scripts/benchmark_tables.py --rows 500 --cols 100
+    python scripts/benchmark_tables.py --rows 200 --cols 20 --text-cols 5 --repeats 10
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from multiqc.utils import report
+from multiqc.plots import table, table_object
+
+def made_up_table(num_rows, num_cols, num_text_cols):
+    """ Data and headers shaped like those given to table.plot() """
+    rand = random.Random(1)
+    formats = ['{:,.0f}', '{:,.1f}', '{:,.2f}', '{:.3f}']
+    scales = ['RdYlGn', 'GnBu', 'OrRd-rev', 'Blues', False]
+    headers = dict()
+    for i in range(num_cols):
+        k = 'col_{}'.format(i)
+        if i < num_text_cols:
+            headers[k] = {'title': 'Status {}'.format(i), 'scale': False}
+            continue
+        headers[k] = {
+            'title': 'Column {}'.format(i),
+            'format': formats[i % len(formats)],
+            'scale': scales[i % len(scales)],
+            'suffix': '%' if i % 3 == 0 else ''
+        }
+        if i % 2 == 0:
+            headers[k].update({'min': 0, 'max': 100})
+        if i % 7 == 0:
+            headers[k].update({'modify': lambda x: x * 0.000001, 'shared_key': 'read_count'})
+    data = dict()
+    for s in range(num_rows):
+        samp = dict()
+        for i in range(num_cols):
+            if i < num_text_cols:
+                samp['col_{}'.format(i)] = rand.choice(['PASS', 'WARN', 'FAIL'])
+            elif i % 7 == 0:
+                samp['col_{}'.format(i)] = rand.randint(0, 100000000)
+            else:
+                samp['col_{}'.format(i)] = rand.uniform(0, 100)
+        data['sample_{}'.format(s)] = samp
+    return data, headers
+
+def time_table(data, headers, repeats):
+    """ Build the table a number of times. Returns the times for the datatable and the HTML, and the last HTML """
+    dt_times = list()
+    html_times = list()
+    html = None
+    for i in range(repeats):
+        report.html_ids = list()
+        # The datatable changes the dicts that it's given, so use fresh copies
+        d = dict((s, dict(samp)) for s, samp in data.items())
+        h = dict((k, dict(header)) for k, header in headers.items())
+        start = time.time()
+        dt = table_object.datatable(d, h, {'id': 'benchmark_table'})
+        dt_times.append(time.time() - start)
+        start = time.time()
+        html = table.make_table(dt)
+        html_times.append(time.time() - start)
+    return dt_times, html_times, html
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2 == 0:
+        return (values[mid - 1] + values[mid]) / 2.0
+    return values[mid]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark how long MultiQC takes to build the HTML for a table")
+    parser.add_argument('-r', '--rows', type=int, default=500, help="Number of samples (default: 500)")
+    parser.add_argument('-c', '--cols', type=int, default=100, help="Number of columns (default: 100)")
+    parser.add_argument('-t', '--text-cols', type=int, default=3, help="Number of PASS / WARN / FAIL columns (default: 3)")
+    parser.add_argument('-n', '--repeats', type=int, default=3, help="Number of times to build the table (default: 3)")
+    args = parser.parse_args()
+
+    data, headers = made_up_table(args.rows, args.cols, min(args.text_cols, args.cols))
+    num_cells = args.rows * args.cols
+    dt_times, html_times, html = time_table(data, headers, args.repeats)
+    totals = [a + b for a, b in zip(dt_times, html_times)]
+    print("{} x {} table, {:.1f} MB of HTML".format(args.rows, args.cols, len(html) / 1e6))
+    for name, times in [('datatable', dt_times), ('make_table', html_times), ('total', totals)]:
+        print("{:<10} median {:.3f}s, min {:.3f}s, max {:.3f}s, {:,.0f} cells/s".format(
+            name, median(times), min(times), max(times), num_cells / median(times)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+""" Check that old style find_log_files() search patterns find the same files
+with --file-list as when searching a directory.
+
+Makes a few log files in a temporary directory and runs the file search on the
+directory, and again on a list of its files, as with `multiqc --file-list`.
+Each time, report.search_pattern_files() is given a search pattern dict, as
+for find_log_files({'fn': ...}), and should find the same files. Exits with
+an error if it doesn't.
+
+    python scripts/check_filelist_search.py
+"""
+
+from __future__ import print_function
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from multiqc.utils import config, report
+
+SEARCH_PATTERNS = [
+    {'fn': '*.mylog'},
+    {'contents': 'My tool version'},
+    {'fn': '*.txt', 'contents_re': '^Reads: [0-9]+$'}
+]
+
+def make_logs(tmp_dir):
+    """ Write some log files to match, and some that shouldn't, returning their paths """
+    logs = {
+        'a.mylog': u'Reads: 10\n',
+        'b.txt': u'My tool version 1.0\n',
+        'c.txt': u'Header\nReads: 20\n',
+        'd.txt': u'Nothing to see here\n'
+    }
+    paths = list()
+    for fn, contents in sorted(logs.items()):
+        path = os.path.join(tmp_dir, fn)
+        with io.open(path, 'w', encoding='utf-8') as fh:
+            fh.write(contents)
+        paths.append(path)
+    return paths
+
+def search(analysis_dir, file_list=False):
+    """ Run the file search, then find the files for each search pattern """
+    config.reset()
+    # As set up by multiqc.run(), which only searches the listed files with --file-list
+    config.analysis_dir = [] if file_list else [analysis_dir]
+    config.file_list = file_list
+    report.init()
+    report.get_filelist([])
+    return [sorted(os.path.join(f['root'], f['fn']) for f in report.search_pattern_files(sp)) for sp in SEARCH_PATTERNS]
+
+def main():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        logs_dir = os.path.join(tmp_dir, 'logs')
+        os.makedirs(logs_dir)
+        list_fn = os.path.join(tmp_dir, 'file_list.txt')
+        with io.open(list_fn, 'w', encoding='utf-8') as fh:
+            fh.write(u''.join(p + u'\n' for p in make_logs(logs_dir)))
+        dir_files = search(logs_dir)
+        list_files = search(logs_dir, list_fn)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    ok = True
+    for sp, d, l in zip(SEARCH_PATTERNS, dir_files, list_files):
+        print("{}: {} files from the directory, {} from the file list".format(sp, len(d), len(l)))
+        if len(d) == 0 or [os.path.basename(p) for p in d] != [os.path.basename(p) for p in l]:
+            ok = False
+    if not ok:
+        print("Error: the file list search didn't find the same files", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()